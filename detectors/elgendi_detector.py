@@ -0,0 +1,121 @@
+import logging
+from concurrent.futures import Executor
+from typing import Callable, Optional
+
+import numpy as np
+
+from detectors.moving_window import WindowAlignment, moving_window_integrate
+from detectors.qrs_detectors import QRSDetector
+from models.annotation import Annotation
+from models.ecg import ECGContainer, ECGLead, LeadName
+
+
+class ElgendiDetector(QRSDetector):
+    """
+    Credits:
+    Elgendi, M., 2013. Fast QRS Detection with an Optimized Knowledge-Based Method: Evaluation on 11 Standard
+    ECG Databases. PLoS ONE, 8(9), e73557.
+
+    Two moving averages algorithm steps:
+        1. Signal bandpass filtering.
+        2. Signal squaring.
+        3. Moving averages over a QRS and over a beat long windows.
+        4. Blocks of interest - samples where the QRS average exceeds the beat average raised by a fraction
+           of the signal mean.
+        5. Blocks at least as long as the QRS window are QRS complexes, R peak is the block's maximum.
+        6. QRS detection.
+
+    It's a few passes over the signal, with no per-peak processing, so it's much cheaper than Pan-Tompkins.
+    """
+
+    def __init__(self):
+        self.qrs_window = 97  # milliseconds
+        self.beat_window = 611  # milliseconds
+        self.offset = 0.08  # fraction of the squared signal mean
+        self.min_peak_distance = 200  # milliseconds
+
+    @property
+    def parameters(self) -> dict:
+        return {
+            "detector": type(self).__name__,
+            "qrs_window": self.qrs_window,
+            "beat_window": self.beat_window,
+            "offset": self.offset,
+            "min_peak_distance": self.min_peak_distance,
+        }
+
+    def detect(
+        self,
+        ecg: ECGContainer,
+        executor: Optional[Executor] = None,
+        progress: Optional[Callable[[LeadName], None]] = None,
+    ):
+        map_fn = executor.map if executor else map
+        annotations = map_fn(self._detect_lead, ecg.ecg_leads)
+        self._set_annotations(ecg.ecg_leads, annotations, progress)
+
+    def _detect_lead(self, lead: ECGLead) -> Annotation:
+        logging.info(f"Detecting R peaks for: {lead.label}")
+        # leads are copied when sent to a process pool, so annotations are handed back explicitly
+        return self._annotate(lead, self._detect_r_peaks(lead))
+
+    def _detect_r_peaks(self, lead: ECGLead) -> np.ndarray[int]:
+        # STEP 1: Signal filtering
+        if lead.is_filtered is not True:
+            raise Exception(
+                "Signal must be filtered. Make sure to run bandpass filtering first."
+            )
+
+        ecg_signal = lead.waveform
+        qrs_window_samples = max(1, int(self.qrs_window * lead.fs / 1000))
+        beat_window_samples = max(1, int(self.beat_window * lead.fs / 1000))
+
+        # STEP 2: Squaring
+        squared = np.square(ecg_signal)
+
+        # STEP 3: Moving averages
+        qrs_average = moving_window_integrate(
+            squared, qrs_window_samples, WindowAlignment.CENTERED
+        )
+        qrs_average /= qrs_window_samples
+        threshold = moving_window_integrate(
+            squared, beat_window_samples, WindowAlignment.CENTERED
+        )
+        threshold /= beat_window_samples
+        threshold += self.offset * np.mean(squared)
+
+        # STEP 4: Blocks of interest
+        edges = np.flatnonzero(
+            np.diff((qrs_average > threshold).astype(np.int8), prepend=0, append=0)
+        )
+        starts, ends = edges[::2], edges[1::2]
+
+        # STEP 5: QRS complexes
+        is_qrs = ends - starts >= qrs_window_samples
+        r_peaks = [
+            start + np.argmax(squared[start:end])
+            for start, end in zip(starts[is_qrs].tolist(), ends[is_qrs].tolist())
+        ]
+
+        return self._drop_close_peaks(
+            np.asarray(r_peaks, dtype=np.int64),
+            squared,
+            int(self.min_peak_distance * lead.fs / 1000),
+        )
+
+    @staticmethod
+    def _drop_close_peaks(
+        peaks: np.ndarray[int], squared: np.ndarray[float], distance: int
+    ) -> np.ndarray[int]:
+        """
+        Of peaks closer than the distance (a QRS split into two blocks), only the higher one is kept.
+        """
+        kept: list[int] = []
+        for peak in peaks.tolist():
+            if kept and peak - kept[-1] < distance:
+                if squared[peak] > squared[kept[-1]]:
+                    kept[-1] = peak
+            else:
+                kept.append(peak)
+
+        return np.asarray(kept, dtype=np.int64)
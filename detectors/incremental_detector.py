@@ -0,0 +1,323 @@
+from collections import deque
+from typing import Optional
+
+import numpy as np
+from scipy import signal
+
+from detectors.moving_window import MovingWindowIntegrator, WindowAlignment
+from detectors.qrs_detectors import (
+    AdaptiveThresholds,
+    PanTompkinsDetector,
+    PeaksSelectionMethods,
+)
+from models.annotation import Annotation
+
+# wavelet kernel spans at most 10 widths, see PanTompkinsDetector._ricker_windows
+WAVELET_MARGIN = 10 * 7
+
+
+class IncrementalPanTompkinsDetector:
+    """
+    Pan-Tompkins QRS detection of a single lead, fed with blocks of filtered samples as they arrive,
+    e.g. from a device stream or a replayed file.
+
+    Derivative, squaring and integration are carried between blocks. Peaks of the integrated signal are
+    classified with the same adaptive thresholds as `PanTompkinsDetector` uses with ADAPTIVE_THRESHOLD selection,
+    and R peaks are adjusted and delineated in the same way, on a short excerpt of the signal.
+    A beat is emitted as soon as it can't change, see `latency`. Beats found with search-back are emitted when
+    the peak that revealed the gap is classified. Thresholds are trained on the first two seconds,
+    so beats of this period are emitted only after it. Results are the same as of the offline detection,
+    unless there are equally high peaks of the integrated signal - `signal.find_peaks` doesn't define
+    which of them wins.
+
+    Usage:
+        detector = IncrementalPanTompkinsDetector(fs)
+        for block in stream:
+            beats = detector.push(block)
+        beats = detector.finish()
+    """
+
+    def __init__(self, fs: float, detector: Optional[PanTompkinsDetector] = None):
+        """
+        :param detector: offline detector whose parameters are used
+        """
+        self.fs = fs
+        self.detector = detector or PanTompkinsDetector(
+            PeaksSelectionMethods.ADAPTIVE_THRESHOLD
+        )
+        if self.detector.peaks_selection != PeaksSelectionMethods.ADAPTIVE_THRESHOLD:
+            raise RuntimeError(
+                "Only adaptive threshold peaks selection can be done incrementally"
+            )
+
+        window_size = int(self.detector.window_size * fs / 1000)
+        # centered integration needs samples a half of the window ahead
+        self._integration_lag = (
+            (window_size - 1) // 2
+            if self.detector.window_alignment == WindowAlignment.CENTERED
+            else 0
+        )
+        self._peak_distance = int(self.detector.min_peak_distance * fs / 1000)
+        self._shift = int(self._peak_distance / 2)
+        self._training_size = int(2 * fs)
+
+        # derivative and integration state
+        self._last_sample: Optional[float] = None
+        self._integrator = MovingWindowIntegrator(window_size)
+        # integrated samples to drop at the stream start, due to the lag
+        self._integration_skip = self._integration_lag
+
+        # recent filtered and integrated samples, with positions of their first samples
+        self._signal = np.zeros(0)
+        self._signal_start = 0
+        self._integrated = np.zeros(0)
+        self._integrated_start = 0
+
+        self._thresholds: Optional[AdaptiveThresholds] = None
+        # integrated signal peaks before this position are already selected or dropped
+        self._scanned_until = 0
+        # selected peaks close to the scanned part end, they affect the next selections
+        self._selected_positions: set[int] = set()
+        # selected peaks waiting for thresholds training
+        self._candidates: list[tuple[int, float]] = []
+        # R peaks (integrated signal positions) waiting for samples needed to adjust and delineate them
+        self._r_peaks: deque[int] = deque()
+        self._finished = False
+
+    @property
+    def latency(self) -> int:
+        """
+        Maximal delay in samples between an R peak and the end of the block it's emitted with,
+        after thresholds training.
+        """
+        return self._shift + max(
+            self._peak_distance + self._integration_lag, self._delineation_margin
+        )
+
+    @property
+    def _delineation_margin(self) -> int:
+        # adjusted R peak is up to shift from integrated signal peak, and it's delineated within shift around it
+        return 2 * self._shift + WAVELET_MARGIN
+
+    def push(self, samples: np.ndarray[float]) -> Annotation:
+        """
+        :param samples: next block of filtered samples
+        :return: beats detected so far, not emitted before
+        """
+        if self._finished:
+            raise RuntimeError("Detector already finished")
+
+        samples = np.asarray(samples, dtype=float)
+        if samples.size == 0:
+            return Annotation()
+
+        # STEP 2: Derivative, the first sample of the stream gets zero
+        previous = samples[0] if self._last_sample is None else self._last_sample
+        derivative = np.diff(samples, prepend=previous)
+        self._last_sample = samples[-1]
+
+        # STEP 3 & 4: Squaring and moving-window integration
+        self._integrate(derivative**2)
+        self._signal = np.concatenate([self._signal, samples])
+
+        return self._process()
+
+    def finish(self) -> Annotation:
+        """
+        Ends the stream.
+
+        :return: remaining beats
+        """
+        if self._finished:
+            return Annotation()
+
+        # offline integration treats samples after the last one as zeros
+        self._integrate(np.zeros(self._integration_lag))
+        self._finished = True
+        return self._process()
+
+    def _integrate(self, squared: np.ndarray[float]):
+        integrated = self._integrator.push(squared)
+
+        skipped = min(self._integration_skip, integrated.size)
+        self._integration_skip -= skipped
+        self._integrated = np.concatenate([self._integrated, integrated[skipped:]])
+
+    def _process(self) -> Annotation:
+        self._select_candidates()
+
+        integrated_end = self._integrated_start + self._integrated.size
+        if self._thresholds is None and (
+            integrated_end >= self._training_size or self._finished
+        ):
+            # nothing has been trimmed before training, integrated signal starts at 0
+            self._thresholds = AdaptiveThresholds(
+                self._integrated[: self._training_size]
+            )
+
+        if self._thresholds is not None:
+            for position, height in self._candidates:
+                self._r_peaks.extend(self._thresholds.classify(position, height))
+            self._candidates.clear()
+
+        beats = self._delineate_ready_peaks()
+        self._trim()
+        return beats
+
+    def _select_candidates(self):
+        """
+        Selects integrated signal peaks the way `signal.find_peaks` with minimal distance does - peaks are visited
+        from the highest one, and a peak is dropped if a higher selected peak is closer than the distance.
+        A peak is decided once all the peaks it depends on are known, peaks before `_scanned_until` are decided.
+        """
+        integrated_end = self._integrated_start + self._integrated.size
+        # peaks closer than the distance to the end might still have unknown neighbours
+        known_until = (
+            integrated_end if self._finished else integrated_end - self._peak_distance
+        )
+        if known_until <= self._scanned_until:
+            return
+
+        peaks, _ = signal.find_peaks(self._integrated)
+        positions = (peaks + self._integrated_start).tolist()
+        heights = self._integrated[peaks].tolist()
+
+        # True - selected, False - dropped, None - not decided yet
+        selected: list[Optional[bool]] = [None] * len(positions)
+        # equal peaks - the later one goes first
+        for ii in sorted(
+            range(len(positions)), key=lambda x: (heights[x], x), reverse=True
+        ):
+            position = positions[ii]
+            if position < self._scanned_until:
+                selected[ii] = position in self._selected_positions
+                continue
+            if position >= known_until:
+                continue
+
+            # all the higher peaks are visited already
+            higher = [
+                selected[x]
+                for x in self._neighbours(positions, ii)
+                if (heights[x], x) > (heights[ii], ii)
+            ]
+            if True in higher:
+                selected[ii] = False
+            elif None not in higher:
+                selected[ii] = True
+
+        undecided = [
+            x
+            for x, is_selected in zip(positions, selected)
+            if is_selected is None and x >= self._scanned_until
+        ]
+        scanned_until = min(undecided + [known_until])
+
+        for position, height, is_selected in zip(positions, heights, selected):
+            if self._scanned_until <= position < scanned_until and is_selected:
+                self._candidates.append((position, height))
+                self._selected_positions.add(position)
+
+        self._scanned_until = scanned_until
+        self._selected_positions = {
+            x
+            for x in self._selected_positions
+            if x > self._scanned_until - self._peak_distance
+        }
+
+    def _neighbours(self, positions: list[int], index: int) -> list[int]:
+        """
+        :return: indices of peaks closer than the minimal peak distance
+        """
+        neighbours = []
+        ii = index - 1
+        while ii >= 0 and positions[index] - positions[ii] < self._peak_distance:
+            neighbours.append(ii)
+            ii -= 1
+        ii = index + 1
+        while (
+            ii < len(positions)
+            and positions[ii] - positions[index] < self._peak_distance
+        ):
+            neighbours.append(ii)
+            ii += 1
+        return neighbours
+
+    def _delineate_ready_peaks(self) -> Annotation:
+        signal_end = self._signal_start + self._signal.size
+        r_peaks, onsets, offsets = [], [], []
+
+        while self._r_peaks and (
+            self._finished or self._r_peaks[0] + self._delineation_margin <= signal_end
+        ):
+            position = self._r_peaks.popleft()
+
+            excerpt_start, excerpt = self._excerpt(position)
+            r_peak = (
+                self.detector._adjust_peaks(
+                    excerpt, np.array([position - excerpt_start]), self._shift
+                )[0]
+                + excerpt_start
+            )
+
+            excerpt_start, excerpt = self._excerpt(r_peak)
+            onset, offset = self.detector._delineate(
+                excerpt, np.array([r_peak - excerpt_start]), self.fs
+            )
+
+            r_peaks.append(r_peak)
+            onsets.append(onset[0] + excerpt_start)
+            offsets.append(offset[0] + excerpt_start)
+
+        return Annotation(
+            r_peak_positions=np.asarray(r_peaks, dtype=np.int64),
+            onsets=np.asarray(onsets, dtype=np.int64),
+            offsets=np.asarray(offsets, dtype=np.int64),
+        )
+
+    def _excerpt(self, position: int) -> tuple[int, np.ndarray[float]]:
+        """
+        Signal around the position, long enough for its window wavelet transform to be the same as for the whole signal.
+        """
+        margin = self._shift + WAVELET_MARGIN
+        start = max(position - margin, self._signal_start)
+        return (
+            start,
+            self._signal[
+                start - self._signal_start : position + margin - self._signal_start
+            ],
+        )
+
+    def _trim(self):
+        """
+        Drops samples that aren't needed anymore, so memory usage doesn't grow with the stream length.
+        """
+        if self._thresholds is None:
+            return
+
+        # R peaks can still come from the pending ones, from not selected peaks and the noise peak (search-back).
+        # Search-back needs RR intervals - until there are any, the noise peak is dropped on the next beat unused,
+        # so it isn't kept, e.g. for a flat signal after the first beat.
+        noise_peak = self._thresholds.noise_peak
+        oldest_position = min(
+            [self._scanned_until]
+            + list(self._r_peaks)
+            + (
+                [noise_peak[0]]
+                if noise_peak is not None and self._thresholds.rr_intervals
+                else []
+            )
+        )
+
+        signal_start = max(
+            self._signal_start, oldest_position - self._delineation_margin
+        )
+        self._signal = self._signal[signal_start - self._signal_start :]
+        self._signal_start = signal_start
+
+        # neighbours of not selected peaks must be kept, with one sample before them to tell they're peaks
+        integrated_start = max(
+            self._integrated_start, self._scanned_until - self._peak_distance - 1
+        )
+        self._integrated = self._integrated[integrated_start - self._integrated_start :]
+        self._integrated_start = integrated_start
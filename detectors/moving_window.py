@@ -0,0 +1,104 @@
+from enum import Enum
+from typing import Optional
+
+import numpy as np
+
+# samples after which the running cumulative sum is restarted
+DEFAULT_BLOCK_SIZE = 2**16
+
+
+class WindowAlignment(Enum):
+    # window ends at the sample
+    CAUSAL = "causal"
+    # window is centered at the sample, as in np.convolve(..., mode="same")
+    CENTERED = "centered"
+
+
+class MovingWindowIntegrator:
+    """
+    Causal moving-window sum (sum of the last `window_size` samples) of a stream fed array by array,
+    samples before the stream start are zeros.
+
+    Sums are differences of a running cumulative sum, so the cost doesn't depend on the window size.
+    To bound its rounding error, the cumulative sum is restarted every `block_size` samples. Blocks are counted
+    from the stream start, so results don't depend on how the stream is split into pushed arrays.
+    """
+
+    def __init__(self, window_size: int, block_size: int = DEFAULT_BLOCK_SIZE):
+        if window_size < 1:
+            raise RuntimeError("Integration window must have at least one sample")
+        if block_size < window_size:
+            raise RuntimeError("Block can't be shorter than the integration window")
+
+        self.window_size = window_size
+        self.block_size = block_size
+
+        # running cumulative sum at the last window_size samples
+        self._cumsum = np.zeros(window_size)
+        self._position = 0
+        # cumulative sum of the last window and the pushed samples, allocated once
+        self._buffer = np.empty(window_size + block_size)
+
+    def push(
+        self, samples: np.ndarray[float], out: Optional[np.ndarray[float]] = None
+    ) -> np.ndarray[float]:
+        """
+        :param out: optional float64 array of the samples length to store sums in
+        :return: moving-window sums of the samples
+        """
+        samples = np.asarray(samples, dtype=float)
+        out = np.empty(samples.size) if out is None else out
+
+        start = 0
+        while start < samples.size:
+            block_offset = self._position % self.block_size
+            if block_offset == 0:
+                # values in the window are kept, only relative to its beginning
+                self._cumsum -= self._cumsum[0]
+
+            end = min(start + self.block_size - block_offset, samples.size)
+            self._integrate(samples[start:end], out[start:end])
+            self._position += end - start
+            start = end
+
+        return out
+
+    def _integrate(self, samples: np.ndarray[float], out: np.ndarray[float]):
+        size = samples.size
+        buffer = self._buffer[: self.window_size + size]
+
+        buffer[: self.window_size] = self._cumsum
+        buffer[self.window_size :] = samples
+        np.cumsum(buffer[self.window_size - 1 :], out=buffer[self.window_size - 1 :])
+
+        np.subtract(buffer[self.window_size :], buffer[:size], out=out)
+        self._cumsum[:] = buffer[size:]
+
+
+def moving_window_integrate(
+    samples: np.ndarray[float],
+    window_size: int,
+    alignment: WindowAlignment = WindowAlignment.CAUSAL,
+    out: Optional[np.ndarray[float]] = None,
+) -> np.ndarray[float]:
+    """
+    Moving-window sum of a whole signal, of the same length as the signal. Samples outside the signal are zeros,
+    so e.g. the centered sum is the same as np.convolve(samples, np.ones(window_size), mode="same") up to rounding.
+
+    :param out: optional float64 array of the samples length to store sums in, can be the samples array itself
+    """
+    samples = np.asarray(samples, dtype=float)
+    out = np.empty(samples.size) if out is None else out
+    integrator = MovingWindowIntegrator(window_size)
+
+    if alignment == WindowAlignment.CAUSAL:
+        return integrator.push(samples, out)
+    elif alignment == WindowAlignment.CENTERED:
+        # centered sum is the causal one of the signal followed by zeros, shifted back by a half of the window
+        lag = min((window_size - 1) // 2, samples.size)
+        integrator.push(samples[:lag])
+        integrator.push(samples[lag:], out[: samples.size - lag])
+        integrator.push(np.zeros(lag), out[samples.size - lag :])
+        return out
+    else:
+        raise RuntimeError(f"Window alignment {alignment} not known")
@@ -1,12 +1,255 @@
+import abc
+import dataclasses
 import logging
+from collections import deque
+from concurrent.futures import Executor
+from enum import Enum
+from functools import partial
+from typing import Callable, Iterable, Optional
+
 import numpy as np
 from scipy import signal
 
-from models.annotation import QRSComplex
-from models.ecg import ECGContainer, ECGLead
+from detectors.moving_window import WindowAlignment, moving_window_integrate
+from models.annotation import Annotation
+from models.ecg import ECGContainer, ECGLead, LeadName
+
+
+class PeaksSelectionMethods(Enum):
+    CWT = "cwt"
+    ADAPTIVE_THRESHOLD = "adaptive_threshold"
+
+
+class AdaptiveThresholds:
+    """
+    Pan-Tompkins running signal (SPKI) and noise (NPKI) peak levels with dual thresholds.
+    Peaks of the integrated signal are classified one by one, in order of their positions.
+    """
+
+    def __init__(self, training: np.ndarray[float]):
+        """
+        :param training: beginning of the integrated signal, the original algorithm uses 2 seconds
+        """
+        self.spki = 0.25 * np.max(training)
+        self.npki = 0.5 * np.mean(training)
 
+        self.last_r_peak: Optional[int] = None
+        self.rr_intervals: deque[int] = deque(maxlen=8)
+        # highest noise peak (position, height) since the last detected QRS, the search-back candidate.
+        # The first one wins among equally high peaks.
+        self.noise_peak: Optional[tuple[int, float]] = None
 
-class PanTompkinsDetector:
+    def classify(self, position: int, height: float) -> list[int]:
+        """
+        :return: R peaks found - the peak itself and/or a missed one, found with search-back
+        """
+        r_peaks = []
+
+        threshold_1 = self.npki + 0.25 * (self.spki - self.npki)
+        threshold_2 = 0.5 * threshold_1
+
+        rr_average = np.mean(self.rr_intervals) if self.rr_intervals else None
+        if (
+            rr_average is not None
+            and self.noise_peak is not None
+            and position - self.last_r_peak > 1.66 * rr_average
+        ):
+            missed_position, missed_height = self.noise_peak
+            if missed_height > threshold_2:
+                self.rr_intervals.append(missed_position - self.last_r_peak)
+                self.last_r_peak = missed_position
+                r_peaks.append(missed_position)
+                self.spki = 0.25 * missed_height + 0.75 * self.spki
+                threshold_1 = self.npki + 0.25 * (self.spki - self.npki)
+            self.noise_peak = None
+
+        if height > threshold_1:
+            if self.last_r_peak is not None:
+                self.rr_intervals.append(position - self.last_r_peak)
+            self.last_r_peak = position
+            r_peaks.append(position)
+            self.spki = 0.125 * height + 0.875 * self.spki
+            self.noise_peak = None
+        else:
+            self.npki = 0.125 * height + 0.875 * self.npki
+            if self.noise_peak is None or height > self.noise_peak[1]:
+                self.noise_peak = (position, height)
+
+        return r_peaks
+
+
+class QRSDetector(abc.ABC):
+    """
+    Detects QRS complexes - R peaks, onsets and offsets - in all the leads of a container.
+    Detectors differ in how they find beats, R peaks adjustment and QRS delineation are shared.
+    """
+
+    # minimal distance between beats [ms], R peaks are adjusted and QRSes delineated within a half of it around peaks
+    min_peak_distance = 200
+
+    @property
+    @abc.abstractmethod
+    def parameters(self) -> dict:
+        """
+        Parameters that affect detection results, e.g. to tell whether cached results are still valid.
+        """
+        raise NotImplementedError("Subclasses must implement detection parameters.")
+
+    @abc.abstractmethod
+    def detect(
+        self,
+        ecg: ECGContainer,
+        executor: Optional[Executor] = None,
+        progress: Optional[Callable[[LeadName], None]] = None,
+    ):
+        """
+        Sets annotations of the container's leads.
+
+        :param executor: optional pool to process leads concurrently, results are the same as in the serial run.
+        :param progress: called with the lead name whenever a lead is done. Detection stops if it raises,
+            e.g. when cancelled.
+        """
+        raise NotImplementedError("Subclasses must implement the detect method.")
+
+    @staticmethod
+    def _set_annotations(
+        leads: list[ECGLead],
+        annotations: Iterable[Annotation],
+        progress: Optional[Callable[[LeadName], None]] = None,
+    ):
+        """
+        Leads' annotations are replaced only once all of them are ready, so leads are left untouched
+        if detection fails or is cancelled by `progress`.
+
+        :param annotations: annotation per lead, e.g. lazy results of (executor's) map
+        """
+        ready = []
+        for lead, ann in zip(leads, annotations):
+            ready.append(ann)
+            if progress is not None:
+                progress(lead.label)
+
+        for lead, ann in zip(leads, ready):
+            lead.ann = ann
+
+    def _annotate(self, lead: ECGLead, r_peaks: np.ndarray[int]) -> Annotation:
+        """
+        :return: copy of the lead's annotation with given R peaks and their QRS onsets and offsets,
+            the lead itself is not modified
+        """
+        onsets, offsets = self._delineate(lead.waveform, r_peaks, lead.fs)
+        return dataclasses.replace(
+            lead.ann, r_peak_positions=r_peaks, onsets=onsets, offsets=offsets
+        )
+
+    def _delineate(
+        self, ecg_signal: np.ndarray[float], r_peaks: np.ndarray[int], fs: float
+    ) -> tuple[np.ndarray[int], np.ndarray[int]]:
+        """
+        :return: QRS onsets and offsets of given R peaks
+        """
+        r_peaks = np.asarray(r_peaks, dtype=np.int64)
+
+        peak_distance_samples = int(self.min_peak_distance * fs / 1000)
+        shift = int(peak_distance_samples / 2)
+
+        window_starts, window_lengths = self._windows_bounds(
+            r_peaks, shift, ecg_signal.size
+        )
+        relative_peak_positions = r_peaks - window_starts
+
+        # TODO: adjust widths
+        cwt = self._ricker_windows(ecg_signal, window_starts, 2 * shift)
+
+        # second derivative to find zero crossing points, each window is differentiated separately,
+        # so its first two samples are padded with zeros since each diff operation removes one sample
+        cwt_diff_2 = np.zeros_like(cwt)
+        cwt_diff_2[:, 2:] = np.diff(cwt, n=2, axis=1)
+        signbits = np.signbit(cwt_diff_2)
+        signbits[:, :2] = False
+
+        positions = np.arange(2 * shift - 1)
+        is_zc_point = (signbits[:, 1:] != signbits[:, :-1]) & (
+            positions < (window_lengths - 1)[:, np.newaxis]
+        )
+
+        distances = np.where(
+            is_zc_point,
+            np.abs(positions - relative_peak_positions[:, np.newaxis]),
+            np.iinfo(np.int64).max,
+        )
+        r_peak_zc = np.argmin(distances, axis=1)[:, np.newaxis]
+
+        is_onset_zc = is_zc_point & (positions < r_peak_zc)
+        is_offset_zc = is_zc_point & (positions > r_peak_zc)
+        onsets = r_peaks - np.max(np.where(is_onset_zc, positions, 0), axis=1)
+        offsets = r_peaks + np.min(np.where(is_offset_zc, positions, 2 * shift), axis=1)
+
+        # TODO: if zc point not found, then we need to approximate QRS onset and offset using max qrs width
+        #    and magnitude changes. For now window bounds are used instead.
+        onsets = np.where(is_onset_zc.any(axis=1), onsets, window_starts)
+        offsets = np.where(
+            is_offset_zc.any(axis=1), offsets, window_starts + window_lengths - 1
+        )
+
+        return onsets, offsets
+
+    @classmethod
+    def _adjust_peaks(
+        cls, data: np.ndarray[float], peaks: np.ndarray[int], shift: int = 120
+    ) -> np.ndarray[int]:
+        """
+        Find local r-peaks using wavelet components
+        """
+        peaks = np.asarray(peaks, dtype=np.int64)
+        window_starts, window_lengths = cls._windows_bounds(peaks, shift, data.size)
+
+        windows = np.abs(cls._ricker_windows(data, window_starts, 2 * shift))
+        windows[np.arange(2 * shift) >= window_lengths[:, np.newaxis]] = -1.0
+
+        return window_starts + np.argmax(windows, axis=1)
+
+    @staticmethod
+    def _ricker_windows(
+        data: np.ndarray[float],
+        window_starts: np.ndarray[int],
+        window_size: int,
+        width: int = 7,
+    ) -> np.ndarray[float]:
+        """
+        Single width continuous wavelet transform computed only within windows, returned as rows of a 2D array.
+        Values are the same as of the transform of the whole signal (convolution in "same" mode),
+        and don't depend on the signal length. Kernel size follows signal.cwt, i.e. 10 widths,
+        but not more than the window.
+        """
+        if len(window_starts) == 0:
+            return np.zeros((0, window_size))
+
+        kernel = signal.wavelets.ricker(min(10 * width, window_size, data.size), width)
+        # output sample is a dot product of the kernel and the signal starting that many samples before it
+        before = kernel.size - 1 - (kernel.size - 1) // 2
+
+        padded = np.concatenate(
+            [np.zeros(before), data, np.zeros(window_size + kernel.size - 1 - before)]
+        )
+        excerpts = np.lib.stride_tricks.sliding_window_view(
+            padded, window_size + kernel.size - 1
+        )[window_starts]
+
+        return signal.fftconvolve(
+            excerpts, kernel[np.newaxis, ::-1], mode="valid", axes=1
+        )
+
+    @staticmethod
+    def _windows_bounds(
+        peaks: np.ndarray[int], shift: int, size: int
+    ) -> tuple[np.ndarray[int], np.ndarray[int]]:
+        window_starts = np.maximum(0, peaks - shift)
+        window_ends = np.minimum(peaks + shift, size)
+        return window_starts, window_ends - window_starts
+
+
+class PanTompkinsDetector(QRSDetector):
     """
     Credits:
     Pan, J. and Tompkins, W., 1985. A Real-Time QRS Detection Algorithm. IEEE Transactions on Biomedical Engineering,
@@ -22,20 +265,96 @@ class PanTompkinsDetector:
 
     """
 
-    def __init__(self):
+    def __init__(
+        self,
+        peaks_selection: PeaksSelectionMethods = PeaksSelectionMethods.CWT,
+        fused: bool = False,
+    ):
+        """
+        :param fused: detect beats once, on all the leads combined, and only refine them in every lead
+        """
         self.window_size = 150  # PanTompkins processing window size = milliseconds
+        # integrated signal peaks are aligned with QRS complexes, not delayed by a half of the window
+        self.window_alignment = WindowAlignment.CENTERED
         self.min_peak_distance = 200  # milliseconds
+        self.peaks_selection = peaks_selection
+        self.fused = fused
+
+    @property
+    def parameters(self) -> dict:
+        return {
+            "detector": type(self).__name__,
+            "window_size": self.window_size,
+            "window_alignment": self.window_alignment.value,
+            "min_peak_distance": self.min_peak_distance,
+            "peaks_selection": self.peaks_selection.value,
+            "fused": self.fused,
+        }
+
+    def detect(
+        self,
+        ecg: ECGContainer,
+        executor: Optional[Executor] = None,
+        progress: Optional[Callable[[LeadName], None]] = None,
+    ):
+        map_fn = executor.map if executor else map
+
+        if self.fused:
+            beats = self._detect_fused_beats(ecg)
+            annotations = map_fn(
+                partial(self._delineate_lead, r_peaks=beats), ecg.ecg_leads
+            )
+        else:
+            annotations = map_fn(self._detect_lead, ecg.ecg_leads)
+
+        self._set_annotations(ecg.ecg_leads, annotations, progress)
+
+    def _detect_fused_beats(self, ecg: ECGContainer) -> np.ndarray[int]:
+        """
+        Detects beats once for all the leads - on the sum of leads' integrated signals.
+        Each of them is normalized by its mean, so every lead contributes equally.
+        """
+        leads = ecg.ecg_leads
+        if any(lead.is_filtered is not True for lead in leads):
+            raise Exception(
+                "Signal must be filtered. Make sure to run bandpass filtering first."
+            )
+        if len({(lead.fs, lead.waveform.size) for lead in leads}) > 1:
+            raise RuntimeError(
+                "Fused detection requires leads of equal sampling frequency and length"
+            )
+
+        fs = leads[0].fs
+        logging.info("Detecting R peaks on fused leads")
+
+        fused_signal = None
+        for lead in leads:
+            integrated_signal = self._integrated_signal(lead.waveform, fs)
+            if fused_signal is None:
+                fused_signal = np.zeros_like(integrated_signal)
 
-    def detect(self, ecg: ECGContainer):
-        for lead in ecg.ecg_leads:
-            logging.info(f"Detecting R peaks for: {lead.label}")
-            r_peak_indices = self._detect_r_peaks(lead)
-            lead.ann.r_peak_positions = r_peak_indices
-            qrs_complexes = self._detect_qrs_onset_and_offset(lead)
-            lead.ann.qrs_complex_positions = qrs_complexes
+            scale = np.mean(integrated_signal)
+            # flat lead carries no information
+            if scale > 0:
+                fused_signal += integrated_signal / scale
+
+        return self._select_peaks(fused_signal, fs)
+
+    def _delineate_lead(self, lead: ECGLead, r_peaks: np.ndarray[int]) -> Annotation:
+        """
+        Refines beats detected on fused leads - R peaks, onsets and offsets are searched for within
+        windows around them, so the n-th annotation is the same beat in all the leads.
+        """
+        shift = int(int(self.min_peak_distance * lead.fs / 1000) / 2)
+        return self._annotate(lead, self._adjust_peaks(lead.waveform, r_peaks, shift))
+
+    def _detect_lead(self, lead: ECGLead) -> Annotation:
+        logging.info(f"Detecting R peaks for: {lead.label}")
+        r_peak_indices = self._detect_r_peaks(lead)
+        # leads are copied when sent to a process pool, so annotations are handed back explicitly
+        return self._annotate(lead, r_peak_indices)
 
     def _detect_r_peaks(self, lead: ECGLead):
-        window_size_samples = int(self.window_size * lead.fs / 1000)
         peak_distance_samples = int(self.min_peak_distance * lead.fs / 1000)
 
         # STEP 1: Signal filtering
@@ -46,24 +365,11 @@ class PanTompkinsDetector:
 
         ecg_signal = lead.waveform
 
-        # STEP 2: Derivative
-        features_signal = np.ediff1d(ecg_signal)
-
-        # differentiation remove one sample, so we add zero to keep the original size
-        features_signal = np.insert(features_signal, 0, 0)
-
-        # STEP 3: Squaring
-        features_signal = features_signal**2
-
-        # STEP 4: Moving-window integration.
-        features_signal = np.convolve(features_signal, np.ones(window_size_samples))
+        # STEP 2-4
+        features_signal = self._integrated_signal(ecg_signal, lead.fs)
 
         # STEP 5: Peaks selection.
-
-        # default wavelet is "ricker" aka "mex hat"
-        peak_candidates = signal.find_peaks_cwt(
-            vector=features_signal, widths=peak_distance_samples
-        )
+        peak_candidates = self._select_peaks(features_signal, lead.fs)
 
         peak_indices = self._adjust_peaks(
             ecg_signal, peak_candidates, int(peak_distance_samples / 2)
@@ -71,74 +377,71 @@ class PanTompkinsDetector:
 
         return peak_indices
 
-    def _detect_qrs_onset_and_offset(self, lead: ECGLead) -> list[QRSComplex]:
-        if lead.ann.r_peak_positions is None:
-            raise Exception("R peaks must be detected!")
-
-        ecg_signal = lead.waveform
-        r_peaks = lead.ann.r_peak_positions
-
-        peak_distance_samples = int(self.min_peak_distance * lead.fs / 1000)
-
-        qrs_onsets = np.zeros(shape=r_peaks.shape, dtype=np.int64)
-        qrs_offsets = np.zeros(shape=r_peaks.shape, dtype=np.int64)
-
-        shift = int(peak_distance_samples / 2)
-
-        for i, peak in enumerate(r_peaks):
-            window_start = max(0, peak - shift)
-            window_end = min(peak + shift, ecg_signal.size)
-            window = ecg_signal[window_start:window_end]
-
-            relative_peak_position = peak - window_start
-
-            # TODO: adjust widths
-            cwt = signal.cwt(window, wavelet=signal.wavelets.ricker, widths=(7,))
-            cwt = np.squeeze(cwt)
-
-            # second derivative to find zero crossing points,
-            # padded with two zeros since each diff operation removes one sample
-            cwt_diff_2 = np.insert(np.ediff1d(np.ediff1d(cwt)), [0, 1], [0, 0])
-            zc_points = np.flatnonzero(np.diff(np.signbit(cwt_diff_2)))
+    def _integrated_signal(
+        self, ecg_signal: np.ndarray[float], fs: float
+    ) -> np.ndarray[float]:
+        window_size_samples = int(self.window_size * fs / 1000)
 
-            if isinstance(zc_points, tuple):
-                zc_points = zc_points[0]
-
-            r_peak_zc_idx = np.argmin(np.abs(zc_points - relative_peak_position))
-            cwt_qrs_onset_idx = r_peak_zc_idx - 1
-            cwt_qrs_offset_idx = r_peak_zc_idx + 1
+        # STEP 2: Derivative
+        features_signal = np.ediff1d(ecg_signal)
 
-            # TODO: if zc point not found, then we need to approximate QRS onset and offset using max qrs width
-            #    and magnitude changes
-            onset = zc_points[cwt_qrs_onset_idx]
-            offset = zc_points[cwt_qrs_offset_idx]
+        # differentiation remove one sample, so we add zero to keep the original size
+        features_signal = np.insert(features_signal, 0, 0)
 
-            qrs_onsets[i] = peak - onset
-            qrs_offsets[i] = peak + offset
+        # STEP 3: Squaring
+        np.square(features_signal, out=features_signal)
+
+        # STEP 4: Moving-window integration, in place
+        return moving_window_integrate(
+            features_signal,
+            window_size_samples,
+            self.window_alignment,
+            out=features_signal,
+        )
 
-        return [
-            QRSComplex(onset=onset, offset=offset)
-            for onset, offset in zip(qrs_onsets, qrs_offsets)
-        ]
+    def _select_peaks(
+        self, integrated_signal: np.ndarray[float], fs: float
+    ) -> np.ndarray[int]:
+        peak_distance_samples = int(self.min_peak_distance * fs / 1000)
+
+        if self.peaks_selection == PeaksSelectionMethods.ADAPTIVE_THRESHOLD:
+            return self._select_peaks_adaptive_threshold(integrated_signal, fs)
+        elif self.peaks_selection == PeaksSelectionMethods.CWT:
+            # default wavelet is "ricker" aka "mex hat"
+            return signal.find_peaks_cwt(
+                vector=integrated_signal, widths=peak_distance_samples
+            )
+        else:
+            raise RuntimeError(
+                f"Peaks selection method {self.peaks_selection} not known"
+            )
 
-    @staticmethod
-    def _adjust_peaks(
-        data: np.ndarray[float], peaks: np.ndarray[int], shift: int = 120
+    def _select_peaks_adaptive_threshold(
+        self, integrated_signal: np.ndarray[float], fs: float
     ) -> np.ndarray[int]:
         """
-        Find local r-peaks using wavelet components
+        Original Pan-Tompkins dual threshold peaks selection with search-back.
+
+        Local maxima of the integrated signal are found in one vectorized pass, then each of them is classified
+        as a signal or a noise peak with running signal (SPKI) and noise (NPKI) level estimates. When no QRS
+        is found for 166% of the average RR interval, the biggest noise peak above the second threshold
+        in the gap is taken as a missed QRS.
         """
+        refractory_samples = int(self.min_peak_distance * fs / 1000)
+        candidates, _ = signal.find_peaks(
+            integrated_signal, distance=refractory_samples
+        )
 
-        new_peaks = np.zeros(shape=peaks.shape, dtype=np.int64)
+        if candidates.size == 0:
+            return candidates
 
-        for i, peak in enumerate(peaks):
-            window_start = max(0, peak - shift)
-            window_end = min(peak + shift, data.size)
-            window = data[window_start:window_end]
+        heights = integrated_signal[candidates]
 
-            cwt = signal.cwt(window, wavelet=signal.wavelets.ricker, widths=(7,))
-            cwt = np.squeeze(cwt)
+        # thresholds initialization based on the first two seconds of the signal
+        thresholds = AdaptiveThresholds(integrated_signal[: int(2 * fs)])
 
-            new_peaks[i] = window_start + np.argmax(np.abs(cwt))
+        r_peaks: list[int] = []
+        for position, height in zip(candidates.tolist(), heights.tolist()):
+            r_peaks.extend(thresholds.classify(position, height))
 
-        return new_peaks
+        return np.asarray(r_peaks, dtype=np.int64)
@@ -0,0 +1,47 @@
+"""
+QRS detectors available by name - in the explorer, the UI and the batch CLI.
+
+New detectors (subclasses of `QRSDetector`) are made available with `register_detector`.
+"""
+
+from functools import partial
+from typing import Callable
+
+from detectors.elgendi_detector import ElgendiDetector
+from detectors.qrs_detectors import (
+    PanTompkinsDetector,
+    PeaksSelectionMethods,
+    QRSDetector,
+)
+
+DEFAULT_DETECTOR = "pan_tompkins"
+
+_DETECTORS: dict[str, Callable[[], QRSDetector]] = {
+    DEFAULT_DETECTOR: PanTompkinsDetector,
+    "pan_tompkins_adaptive": partial(
+        PanTompkinsDetector, PeaksSelectionMethods.ADAPTIVE_THRESHOLD
+    ),
+    "pan_tompkins_fused": partial(PanTompkinsDetector, fused=True),
+    "elgendi": ElgendiDetector,
+}
+
+
+def register_detector(name: str, factory: Callable[[], QRSDetector]):
+    """
+    :param factory: creates a detector, e.g. detector class
+    """
+    if name in _DETECTORS:
+        raise RuntimeError(f"Detector {name} already registered")
+
+    _DETECTORS[name] = factory
+
+
+def available_detectors() -> list[str]:
+    return list(_DETECTORS)
+
+
+def create_detector(name: str = DEFAULT_DETECTOR) -> QRSDetector:
+    if name not in _DETECTORS:
+        raise RuntimeError(f"Detector {name} not known")
+
+    return _DETECTORS[name]()
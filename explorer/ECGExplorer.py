@@ -1,46 +1,136 @@
 import os
-import statistics
-from typing import Optional, Callable
+from concurrent.futures import Executor
+from enum import Enum
+from typing import Callable, Optional
 
+import numpy as np
 import pandas as pd
 
-from detectors.qrs_detectors import PanTompkinsDetector
+from detectors.qrs_detectors import QRSDetector
+from detectors.registry import create_detector
+from explorer.processing_cache import ProcessingCache
 from filters.ecg_signal_filter import FilterConfig, EcgSignalFilter
 from models.annotation import QRSComplex
 from models.ecg import ECGContainer, LeadName
 
 
+class ReportLayout(Enum):
+    WIDE = "wide"
+    LONG = "long"
+
+
 class ECGExplorer:
     def __init__(
         self,
         container: ECGContainer,
         filter_config: Optional[FilterConfig] = None,
+        cache: Optional[ProcessingCache] = None,
+        detector: Optional[QRSDetector] = None,
     ):
+        """
+        :param detector: QRS detector, default one from the registry if not set
+        """
         self._container = container
         self._filter_config = filter_config
         self._filter: Optional[EcgSignalFilter] = (
             EcgSignalFilter(filter_config) if filter_config else None
         )
-        self._r_detector = PanTompkinsDetector()
+        self._r_detector = detector or create_detector()
+        self._cache = cache
+        self._file_digest: Optional[str] = None
 
     @classmethod
     def load_from_file(
-        cls, filepath: str, filter_config: Optional[FilterConfig] = None
+        cls,
+        filepath: str,
+        filter_config: Optional[FilterConfig] = None,
+        cache: Optional[ProcessingCache] = None,
+        lazy: bool = False,
+        detector: Optional[QRSDetector] = None,
     ):
+        """
+        :param cache: if set, decoded file is cached in it, and re-opening the same file reads it from there
+        :param lazy: defer waveform decoding until a lead is accessed, supported for dicom files only.
+            Caching the file would decode all the leads, so a lazily loaded file isn't stored in the cache,
+            it's only read from there if already cached.
+        """
         if not os.path.isfile(filepath):
             raise FileNotFoundError()
 
         ext = os.path.splitext(filepath)[-1].lower()
+        if ext not in (".dcm", ".xml"):
+            return None
+
+        file_digest = cache.file_digest(filepath) if cache is not None else None
+        container = cache.load_container(file_digest) if cache is not None else None
+
+        if container is not None:
+            # the same content might have been cached from another location
+            container.file_path = filepath
+        else:
+            if ext == ".dcm":
+                container = ECGContainer.from_dicom_file(filepath, lazy)
+            else:
+                container = ECGContainer.from_ge_xml_file(filepath)
+
+            if cache is not None and not lazy:
+                cache.store_container(file_digest, container)
 
-        if ext == ".dcm":
-            return cls(ECGContainer.from_dicom_file(filepath), filter_config)
-        if ext.lower() == ".xml":
-            return cls(ECGContainer.from_ge_xml_file(filepath), filter_config)
+        explorer = cls(container, filter_config, cache, detector)
+        explorer._file_digest = file_digest
+        return explorer
 
-    def process(self, peaks_detection: bool = False):
-        self._filter.filter(self._container)
+    def process(
+        self,
+        peaks_detection: bool = False,
+        executor_class: Optional[type[Executor]] = None,
+        max_workers: Optional[int] = None,
+        progress: Optional[Callable[[LeadName], None]] = None,
+    ):
+        """
+        :param peaks_detection: run QRS detection after filtering
+        :param executor_class: e.g. ThreadPoolExecutor or ProcessPoolExecutor. If set, leads are processed
+            concurrently in a pool of this type. Results are identical to the serial processing.
+        :param max_workers: pool size, executor default is used if not set
+        :param progress: called with the lead name whenever a lead is filtered, and once more when its QRS detection
+            is done. Processing stops if it raises, e.g. when cancelled - then detection results are discarded,
+            see `QRSDetector.detect`.
+        """
+        cache_key = self._cache_key(peaks_detection)
+        if cache_key is not None and self._cache.load(cache_key, self._container):
+            return
+
+        if executor_class is None:
+            self._process(peaks_detection, progress=progress)
+        else:
+            with executor_class(max_workers=max_workers) as executor:
+                self._process(peaks_detection, executor, progress)
+
+        if cache_key is not None:
+            self._cache.store(cache_key, self._container, peaks_detection)
+
+    def _cache_key(self, peaks_detection: bool) -> Optional[str]:
+        if self._cache is None or not os.path.isfile(self._container.file_path):
+            return None
+
+        if self._file_digest is None:
+            self._file_digest = self._cache.file_digest(self._container.file_path)
+
+        return self._cache.key(
+            self._file_digest,
+            self._filter_config,
+            self._r_detector.parameters if peaks_detection else None,
+        )
+
+    def _process(
+        self,
+        peaks_detection: bool,
+        executor: Optional[Executor] = None,
+        progress: Optional[Callable[[LeadName], None]] = None,
+    ):
+        self._filter.filter(self._container, executor, progress)
         if peaks_detection:
-            self._r_detector.detect(self._container)
+            self._r_detector.detect(self._container, executor, progress)
 
     @property
     def container(self):
@@ -55,66 +145,74 @@ class ECGExplorer:
         self._filter_config = filter_config
         self._filter = EcgSignalFilter(self._filter_config)
 
+    @property
+    def detector(self) -> QRSDetector:
+        return self._r_detector
+
+    @detector.setter
+    def detector(self, detector: QRSDetector):
+        self._r_detector = detector
+
     def overwrite_annotations(self, lead_name: LeadName, qrs: list[QRSComplex]):
         lead = self._container.get_lead(lead_name)
         if lead:
             lead.ann.qrs_complex_positions = qrs
 
-    def generate_report(self) -> pd.DataFrame:
-        def _padded(data: list, size: int) -> list:
-            out = [None] * size
-            for cnt, l in enumerate(data):
-                out[cnt] = l
-            return out
-
-        def _safe_statistics(
-            data: list[Optional[float]], statistic: Callable
-        ) -> Optional[float]:
-            if len(data) > 0 and any([x is not None for x in data]):
-                d = [x for x in data if x is not None]
-                return float(f"{(statistic(d)):.2f}")
-            else:
-                return None
-
-        report = pd.DataFrame()
+    def generate_report(self, layout: ReportLayout = ReportLayout.WIDE) -> pd.DataFrame:
+        """
+        :param layout: WIDE - a row per annotation and width & area columns per lead, followed by an empty row,
+            mean and std rows; LONG - a row per lead & annotation, without statistics
+        """
+        leads = self._container.ecg_leads
+        lengths = [
+            np.asarray(lead.calculate_qrs_lengths(), dtype=float) for lead in leads
+        ]
+        areas = [np.asarray(lead.calculate_qrs_areas(), dtype=float) for lead in leads]
+
+        if layout == ReportLayout.LONG:
+            counts = [x.size for x in lengths]
+            return pd.DataFrame(
+                {
+                    "lead": pd.Categorical(
+                        np.repeat([lead.label for lead in leads], counts)
+                    ),
+                    "annotation": np.concatenate(
+                        [np.arange(x, dtype=np.int64) for x in counts]
+                    ),
+                    "width_ms": np.concatenate(lengths),
+                    "area_uV.s": np.concatenate(areas),
+                }
+            )
 
-        max_size = max(
-            len(lead.ann.qrs_complex_positions) for lead in self._container.ecg_leads
-        )
+        max_size = max((x.size for x in lengths), default=0)
 
-        for lead in self._container.ecg_leads:
+        # a column per lead & metric, padded with NaNs, with 3 extra rows: empty one, mean and std
+        columns = []
+        values = np.full((max_size + 3, 2 * len(leads)), np.nan)
+        for cnt, (lead, lead_lengths, lead_areas) in enumerate(
+            zip(leads, lengths, areas)
+        ):
             column_root = lead.label.lower().replace(" ", "_")
+            columns.extend([f"{column_root}_width_ms", f"{column_root}_area_uV.s"])
+            values[: lead_lengths.size, 2 * cnt] = lead_lengths
+            values[: lead_areas.size, 2 * cnt + 1] = lead_areas
 
-            qrs_lengths = _padded(lead.calculate_qrs_lengths(), max_size)
-            # None to add one empty line before mean value
-            qrs_lengths.extend(
-                [
-                    None,
-                    _safe_statistics(qrs_lengths, statistics.mean),
-                    _safe_statistics(qrs_lengths, lambda x: statistics.stdev if (len(x) > 1) else 0.0),
-                ]
-            )
-            qrs_areas = _padded(lead.calculate_qrs_areas(), max_size)
-            # None to add one empty line before mean value
-            qrs_areas.extend(
-                [
-                    None,
-                    _safe_statistics(qrs_areas, statistics.mean),
-                    _safe_statistics(qrs_areas, lambda x: statistics.stdev if (len(x) > 1) else 0.0),
-                ]
-            )
+        annotations = values[:max_size]
+        count = np.count_nonzero(~np.isnan(annotations), axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.nansum(annotations, axis=0) / count
+            std = np.sqrt(np.nansum((annotations - mean) ** 2, axis=0) / (count - 1))
+        std[count == 1] = 0.0
+        std[count == 0] = np.nan
 
-            row_names = [
-                f"annotation {x}"
-                for x in range(len(_padded(lead.calculate_qrs_lengths(), max_size)))
-            ]
-            row_names.extend(["", "mean", "std"])
+        values[max_size + 1] = np.round(mean, 2)
+        values[max_size + 2] = np.round(std, 2)
 
-            report[f"index"] = pd.Series(row_names)
-            report[f"{column_root}_width_ms"] = pd.Series(qrs_lengths)
-            report[f"{column_root}_area_uV.s"] = pd.Series(qrs_areas)
+        row_names = [f"annotation {x}" for x in range(max_size)] + ["", "mean", "std"]
 
-        return report
+        return pd.DataFrame(
+            {"index": row_names} | {k: values[:, i] for i, k in enumerate(columns)}
+        )
 
     def save_annotations(self, filename):
         self._container.save_annotations(filename)
@@ -0,0 +1,215 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from dataclasses import asdict
+from enum import Enum
+from typing import Callable, Optional
+
+import numpy as np
+
+from filters.ecg_signal_filter import FilterConfig
+from models.annotation import Annotation
+from models.ecg import ECGContainer
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".ecg_explorer", "cache")
+# part of every processing results key - bump it whenever filtering or detection results change
+# for the same parameters (e.g. algorithm changes), so stale entries are no longer used
+PROCESSING_VERSION = 1
+
+
+class ProcessingCache:
+    """
+    On-disk cache of processing results (filtered waveforms and detected annotations)
+    and of decoded ECG containers.
+
+    Entries are content addressed - the key is a hash of the source file content, filter config,
+    detector parameters and `PROCESSING_VERSION`, so any change of these results in a new entry.
+    Decoded containers are keyed by file content only and stored as memory-mapped files. Cache size is bounded,
+    least recently used entries are evicted first.
+    """
+
+    ENTRY_EXTENSION = ".npz"
+    CONTAINER_EXTENSION = ".ecgc"
+
+    def __init__(
+        self, directory: str = DEFAULT_CACHE_DIR, max_size_bytes: int = 1024**3
+    ):
+        self.directory = directory
+        self.max_size_bytes = max_size_bytes
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def file_digest(path: str) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as file:
+            for chunk in iter(lambda: file.read(1024**2), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @staticmethod
+    def key(
+        file_digest: str,
+        filter_config: FilterConfig,
+        detector_parameters: Optional[dict] = None,
+    ) -> str:
+        """
+        :param detector_parameters: None if results contain filtered waveforms only
+        """
+
+        def _serialize(obj):
+            if isinstance(obj, Enum):
+                return obj.value
+            raise TypeError(f"Cannot serialize {obj} as cache key")
+
+        key_data = json.dumps(
+            [
+                PROCESSING_VERSION,
+                file_digest,
+                asdict(filter_config),
+                detector_parameters,
+            ],
+            sort_keys=True,
+            default=_serialize,
+        )
+        return hashlib.sha256(key_data.encode()).hexdigest()
+
+    def _entry_path(self, key: str, extension: str = ENTRY_EXTENSION) -> str:
+        return os.path.join(self.directory, key + extension)
+
+    def load_container(self, file_digest: str) -> Optional[ECGContainer]:
+        path = self._entry_path(file_digest, self.CONTAINER_EXTENSION)
+        try:
+            container = ECGContainer.from_mapped_file(path)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.warning(f"Dropping malformed cache entry {path}. Reason: {e}")
+            self._remove(path)
+            return None
+
+        os.utime(path)
+        logging.info(f"Loaded decoded ECG from cache {path}")
+        return container
+
+    def store_container(self, file_digest: str, ecg: ECGContainer):
+        try:
+            self._write_entry(
+                self._entry_path(file_digest, self.CONTAINER_EXTENSION), ecg.save_mapped
+            )
+        except (RuntimeError, OSError) as e:
+            # caching is the best effort, e.g. leads of different lengths can't be mapped or the disk is full
+            logging.warning(f"Couldn't cache decoded ECG. Reason: {e}")
+
+    def load(self, key: str, ecg: ECGContainer) -> bool:
+        """
+        Applies cached results to the container.
+
+        :return: True if results were found in cache
+        """
+        path = self._entry_path(key)
+        try:
+            with np.load(path, allow_pickle=False) as entry:
+                data = {k: entry[k] for k in entry.files}
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            logging.warning(f"Dropping malformed cache entry {path}. Reason: {e}")
+            self._remove(path)
+            return False
+
+        if set(data["labels"].tolist()) != {lead.label for lead in ecg.ecg_leads}:
+            logging.warning(f"Cache entry {path} doesn't match leads, ignoring it")
+            return False
+
+        for lead in ecg.ecg_leads:
+            lead.waveform = data[f"waveform_{lead.label}"]
+            lead.is_filtered = True
+            if bool(data["has_annotations"]):
+                lead.ann = Annotation(
+                    path=lead.ann.path,
+                    r_peak_positions=data[f"r_peaks_{lead.label}"],
+                    onsets=data[f"onsets_{lead.label}"],
+                    offsets=data[f"offsets_{lead.label}"],
+                )
+
+        # touch the entry, it's now the most recently used one
+        os.utime(path)
+        logging.info(f"Loaded processing results from cache {path}")
+        return True
+
+    def store(self, key: str, ecg: ECGContainer, with_annotations: bool):
+        data = {
+            "labels": np.array([lead.label for lead in ecg.ecg_leads]),
+            "has_annotations": np.array(with_annotations),
+        }
+        for lead in ecg.ecg_leads:
+            data[f"waveform_{lead.label}"] = lead.waveform
+            if with_annotations:
+                data[f"r_peaks_{lead.label}"] = np.asarray(
+                    lead.ann.r_peak_positions, dtype=np.int64
+                )
+                data[f"onsets_{lead.label}"] = lead.ann.onsets
+                data[f"offsets_{lead.label}"] = lead.ann.offsets
+
+        def write(path: str):
+            with open(path, "wb") as file:
+                np.savez(file, **data)
+
+        try:
+            self._write_entry(self._entry_path(key), write)
+        except OSError as e:
+            # caching is the best effort, e.g. the disk is full or the cache directory is read-only
+            logging.warning(f"Couldn't cache processing results. Reason: {e}")
+
+    def _write_entry(self, path: str, write: Callable[[str], None]):
+        # write to a temporary file first, so concurrent readers never see partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        os.close(fd)
+        try:
+            write(tmp_path)
+            os.replace(tmp_path, path)
+        except Exception:
+            self._remove(tmp_path)
+            raise
+
+        self._evict()
+
+    def _entries(self) -> list[tuple[str, float, int]]:
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith((self.ENTRY_EXTENSION, self.CONTAINER_EXTENSION)):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((entry.path, stat.st_mtime, stat.st_size))
+        return entries
+
+    def _evict(self):
+        entries = sorted(self._entries(), key=lambda x: x[1])
+        total_size = sum(x[2] for x in entries)
+
+        for path, _, size in entries:
+            if total_size <= self.max_size_bytes:
+                break
+            logging.info(f"Evicting cache entry {path}")
+            if self._remove(path):
+                total_size -= size
+
+    @staticmethod
+    def _remove(path: str) -> bool:
+        """
+        :return: False if the file couldn't be removed, e.g. on Windows a memory-mapped container
+            that is still open can't be deleted. It's skipped and removed later.
+        """
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            # might be already removed by another process sharing the cache
+            pass
+        except OSError as e:
+            logging.warning(f"Couldn't remove cache entry {path}. Reason: {e}")
+            return False
+        return True
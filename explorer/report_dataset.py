@@ -0,0 +1,227 @@
+"""
+Columnar dataset of per-beat QRS metrics of many records.
+
+Dataset is partitioned by lead, Hive-style - `lead=<name>/part-<id>` files hold typed columns (record key,
+annotation number, QRS width and area) of beats of that lead, and the lead key is the directory name.
+Records aren't a partition key, since a directory per record would be a dataset of thousands of tiny files,
+instead every part holds rows of a number of records. Parts are Parquet files if pyarrow is installed,
+npz files (one array per column) otherwise. Both formats let readers load only the columns they need.
+
+Parts written at once share their id, and `part-<id>.records.json` in the dataset directory lists their records,
+so records without any beats are known to be processed too. It's written last, parts are read only once it exists,
+so the dataset is always consistent.
+"""
+
+import glob
+import json
+import os
+import tempfile
+import uuid
+from importlib.util import find_spec
+from typing import Optional
+from urllib.parse import quote, unquote
+
+import numpy as np
+import pandas as pd
+
+RECORD_COLUMN = "record"
+LEAD_COLUMN = "lead"
+COLUMNS_DTYPES = {
+    RECORD_COLUMN: str,
+    LEAD_COLUMN: str,
+    "annotation": np.int64,
+    "width_ms": np.float64,
+    "area_uV.s": np.float64,
+}
+KEY_COLUMNS = (RECORD_COLUMN, LEAD_COLUMN)
+PARTITION_COLUMN = LEAD_COLUMN
+
+PARQUET_EXTENSION = ".parquet"
+NPZ_EXTENSION = ".npz"
+RECORDS_EXTENSION = ".records.json"
+
+
+def parquet_available() -> bool:
+    return find_spec("pyarrow") is not None
+
+
+class ReportDatasetWriter:
+    """
+    Buffers per-beat reports of records and writes them as new parts, one per lead, once the buffer holds
+    `rows_per_part` rows (and on close). Parts are written atomically, so the dataset is always readable,
+    records that weren't flushed are simply missing.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        rows_per_part: int = 100_000,
+        use_parquet: Optional[bool] = None,
+    ):
+        """
+        :param use_parquet: None to use Parquet if pyarrow is installed
+        """
+        self.directory = directory
+        self.rows_per_part = rows_per_part
+        self.use_parquet = parquet_available() if use_parquet is None else use_parquet
+        self._pending: list[pd.DataFrame] = []
+        self._pending_records: list[str] = []
+        self._pending_rows = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def append(self, record: str, report: pd.DataFrame):
+        """
+        :param report: report of a single record in long layout, see `ECGExplorer.generate_report`
+        """
+        self._pending.append(report.assign(**{RECORD_COLUMN: record}))
+        self._pending_records.append(record)
+        self._pending_rows += len(report)
+
+        if self._pending_rows >= self.rows_per_part:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+
+        data = pd.concat(self._pending, ignore_index=True)
+        part_name = f"part-{uuid.uuid4().hex}"
+
+        for lead, lead_data in data.groupby(PARTITION_COLUMN, sort=False):
+            columns = {
+                name: lead_data[name].to_numpy(dtype=dtype)
+                for name, dtype in COLUMNS_DTYPES.items()
+                if name != PARTITION_COLUMN
+            }
+
+            partition = os.path.join(self.directory, _partition_name(lead))
+            os.makedirs(partition, exist_ok=True)
+            part = os.path.join(partition, part_name)
+            if self.use_parquet:
+                self._write(part + PARQUET_EXTENSION, _parquet_writer(columns))
+            else:
+                self._write(part + NPZ_EXTENSION, _npz_writer(columns))
+
+        # parts become visible with their records list
+        self._write(
+            os.path.join(self.directory, part_name + RECORDS_EXTENSION),
+            _records_writer(self._pending_records),
+        )
+
+        self._pending = []
+        self._pending_records = []
+        self._pending_rows = 0
+
+    def close(self):
+        self.flush()
+
+    def _write(self, path: str, write):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        os.close(fd)
+        try:
+            write(tmp_path)
+            os.replace(tmp_path, path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+
+
+def _parquet_writer(columns: dict[str, np.ndarray]):
+    def write(path: str):
+        data = pd.DataFrame(columns)
+        data[RECORD_COLUMN] = data[RECORD_COLUMN].astype("category")
+        data.to_parquet(path, engine="pyarrow", index=False)
+
+    return write
+
+
+def _npz_writer(columns: dict[str, np.ndarray]):
+    def write(path: str):
+        with open(path, "wb") as file:
+            np.savez(file, **columns)
+
+    return write
+
+
+def _records_writer(records: list[str]):
+    def write(path: str):
+        with open(path, "w") as file:
+            json.dump(records, file)
+
+    return write
+
+
+def _partition_name(value: str) -> str:
+    # lead names are escaped, the same as Hive does, so they're valid directory names
+    return f"{PARTITION_COLUMN}={quote(value, safe='')}"
+
+
+def _committed_parts(directory: str) -> set[str]:
+    """
+    :return: names of parts whose records list is written
+    """
+    paths = glob.glob(os.path.join(directory, "part-*" + RECORDS_EXTENSION))
+    return {os.path.basename(x)[: -len(RECORDS_EXTENSION)] for x in paths}
+
+
+def read_report_dataset(
+    directory: str, columns: Optional[list[str]] = None
+) -> pd.DataFrame:
+    """
+    :param columns: columns to read, all if None
+    """
+    columns = list(COLUMNS_DTYPES) if columns is None else columns
+    # partition column isn't stored in parts, some column is still read to know the number of rows
+    file_columns = [x for x in columns if x != PARTITION_COLUMN] or [RECORD_COLUMN]
+    committed = _committed_parts(directory)
+
+    parts = []
+    pattern = os.path.join(directory, f"{PARTITION_COLUMN}=*", "part-*")
+    for path in sorted(glob.glob(pattern)):
+        part_name, extension = os.path.splitext(os.path.basename(path))
+        if part_name not in committed:
+            continue
+
+        if extension == PARQUET_EXTENSION:
+            part = pd.read_parquet(path, columns=file_columns)
+        elif extension == NPZ_EXTENSION:
+            # npz members are loaded lazily, only requested columns are read
+            with np.load(path, allow_pickle=False) as file:
+                part = pd.DataFrame({name: file[name] for name in file_columns})
+        else:
+            continue
+
+        partition = os.path.basename(os.path.dirname(path))
+        part[PARTITION_COLUMN] = unquote(partition.split("=", 1)[1])
+        parts.append(part[columns])
+
+    if parts:
+        data = pd.concat(parts, ignore_index=True)
+    else:
+        data = pd.DataFrame(
+            {name: np.zeros(0, dtype=COLUMNS_DTYPES[name]) for name in columns}
+        )
+
+    for name in KEY_COLUMNS:
+        if name in data:
+            data[name] = data[name].astype("category")
+
+    return data
+
+
+def read_records(directory: str) -> set[str]:
+    """
+    :return: keys of records present in the dataset, including the ones without any beats
+    """
+    records = set()
+    for path in glob.glob(os.path.join(directory, "part-*" + RECORDS_EXTENSION)):
+        with open(path) as file:
+            records.update(json.load(file))
+
+    return records
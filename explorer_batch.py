@@ -0,0 +1,281 @@
+"""
+Headless QRS report generation for many ECG files.
+
+Every file is loaded, filtered, annotated with QRS detector and summarized with `ECGExplorer.generate_report`.
+Reports of all files (in wide or long layout, see `ReportLayout`) are appended to a single CSV file as soon as
+they're ready, so an interrupted run can be resumed - files already present in the output are skipped. Files that
+couldn't be processed are listed in `<output>.errors.csv` and retried on the next run.
+
+With `--dataset` per-beat metrics are appended to a columnar dataset (see `explorer.report_dataset`) instead,
+then output is the dataset directory.
+
+Usage:
+    python explorer_batch.py ./resources "./archive/**/*.Xml" -o report.csv --workers 8 --layout long
+    python explorer_batch.py "./archive/**/*.Xml" -o ./report_dataset --dataset --detector elgendi
+"""
+
+import argparse
+import csv
+import glob
+import logging
+import os
+import sys
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import ExitStack
+from typing import Optional
+
+import pandas as pd
+
+from detectors.registry import DEFAULT_DETECTOR, available_detectors, create_detector
+from explorer.ECGExplorer import ECGExplorer, ReportLayout
+from explorer.processing_cache import ProcessingCache
+from explorer.report_dataset import ReportDatasetWriter, read_records
+from filters.ecg_signal_filter import FilterConfig, FilterMethods
+from models.ecg import ECGContainer
+
+SUPPORTED_EXTENSIONS = (".dcm", ".xml")
+FILE_COLUMN = "file"
+
+logging.basicConfig(level=logging.WARN)
+
+
+def find_files(inputs: list[str]) -> list[str]:
+    """
+    :param inputs: directories (searched recursively) or glob patterns
+    :return: sorted, unique paths of supported ECG files
+    """
+    files = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            candidates = glob.glob(os.path.join(item, "**", "*"), recursive=True)
+        else:
+            candidates = glob.glob(item, recursive=True)
+
+        files.update(
+            os.path.abspath(x)
+            for x in candidates
+            if os.path.isfile(x)
+            and os.path.splitext(x)[-1].lower() in SUPPORTED_EXTENSIONS
+        )
+
+    return sorted(files)
+
+
+def report_columns(layout: ReportLayout = ReportLayout.WIDE) -> list[str]:
+    """
+    Records can have different set of leads, so the consolidated wide report always has columns for all of them.
+    """
+    if layout == ReportLayout.LONG:
+        return [FILE_COLUMN, "lead", "annotation", "width_ms", "area_uV.s"]
+
+    columns = [FILE_COLUMN, "index"]
+    for lead in ECGContainer.EXPECTED_LEADS_ORDER:
+        column_root = lead.lower().replace(" ", "_")
+        columns.extend([f"{column_root}_width_ms", f"{column_root}_area_uV.s"])
+    return columns
+
+
+def process_file(
+    path: str,
+    filter_config: FilterConfig,
+    cache_dir: Optional[str] = None,
+    layout: ReportLayout = ReportLayout.WIDE,
+    detector: str = DEFAULT_DETECTOR,
+) -> tuple[str, Optional[pd.DataFrame], Optional[str]]:
+    """
+    Worker entry point. Never raises, so one broken file doesn't stop the whole batch.
+
+    :param cache_dir: processing results are cached there if set
+    :param detector: name of the QRS detector, see `detectors.registry`
+    :return: path, report (if succeeded) and error description (if failed)
+    """
+    try:
+        cache = ProcessingCache(cache_dir) if cache_dir else None
+        explorer = ECGExplorer.load_from_file(
+            path, filter_config, cache, detector=create_detector(detector)
+        )
+        explorer.process(peaks_detection=True)
+        report = explorer.generate_report(layout)
+    except Exception as e:
+        logging.debug(traceback.format_exc())
+        return path, None, f"{type(e).__name__}: {e}"
+
+    report.insert(0, FILE_COLUMN, path)
+    return path, report.reindex(columns=report_columns(layout)), None
+
+
+def load_processed_files(output: str) -> set[str]:
+    if not os.path.isfile(output) or os.path.getsize(output) == 0:
+        return set()
+
+    return set(pd.read_csv(output, usecols=[FILE_COLUMN])[FILE_COLUMN].dropna())
+
+
+def run_batch(
+    files: list[str],
+    output: str,
+    filter_config: FilterConfig,
+    max_workers: Optional[int] = None,
+    cache_dir: Optional[str] = None,
+    layout: ReportLayout = ReportLayout.WIDE,
+    dataset: bool = False,
+    detector: str = DEFAULT_DETECTOR,
+) -> tuple[int, int]:
+    """
+    :param dataset: output is a columnar dataset directory, reports are always in long layout then
+    :return: number of processed and failed files
+    """
+    if dataset:
+        output = os.path.normpath(output)
+        layout = ReportLayout.LONG
+        processed_files = read_records(output)
+    else:
+        processed_files = load_processed_files(output)
+    pending = [x for x in files if x not in processed_files]
+
+    print(
+        f"Found {len(files)} files, {len(files) - len(pending)} already processed",
+        file=sys.stderr,
+    )
+
+    if not pending:
+        return 0, 0
+
+    write_header = len(processed_files) == 0
+    processed, failed = 0, 0
+
+    with ExitStack() as stack:
+        if dataset:
+            dataset_writer = stack.enter_context(ReportDatasetWriter(output))
+        else:
+            report_file = stack.enter_context(
+                open(output, "a" if not write_header else "w", newline="")
+            )
+        errors_file = stack.enter_context(open(f"{output}.errors.csv", "w", newline=""))
+        executor = stack.enter_context(ProcessPoolExecutor(max_workers=max_workers))
+
+        errors_writer = csv.writer(errors_file)
+        errors_writer.writerow([FILE_COLUMN, "error"])
+
+        futures = [
+            executor.submit(process_file, x, filter_config, cache_dir, layout, detector)
+            for x in pending
+        ]
+
+        for cnt, future in enumerate(as_completed(futures), start=1):
+            path, report, error = future.result()
+
+            if error is None:
+                if dataset:
+                    dataset_writer.append(path, report.drop(columns=FILE_COLUMN))
+                else:
+                    report.to_csv(report_file, header=write_header, index=False)
+                    report_file.flush()
+                    write_header = False
+                processed += 1
+                status = "done"
+            else:
+                errors_writer.writerow([path, error])
+                errors_file.flush()
+                failed += 1
+                status = f"failed ({error})"
+
+            print(f"[{cnt}/{len(pending)}] {path}: {status}", file=sys.stderr)
+
+    return processed, failed
+
+
+def filter_config_from_args(args: argparse.Namespace) -> FilterConfig:
+    method = FilterMethods(args.filter_method)
+    default = (
+        FilterConfig.default_bandpass()
+        if method == FilterMethods.BANDPASS
+        else FilterConfig.default_lowpass()
+    )
+
+    return FilterConfig(
+        filter_method=method,
+        lowcut_frequency=(
+            args.lowcut if args.lowcut is not None else default.lowcut_frequency
+        ),
+        highcut_frequency=(
+            args.highcut if args.highcut is not None else default.highcut_frequency
+        ),
+        filter_order=(
+            args.filter_order if args.filter_order is not None else default.filter_order
+        ),
+        zero_phase=args.zero_phase,
+    )
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Generate QRS width/area report for many ECG files (dicom and GE XML)."
+    )
+    parser.add_argument(
+        "inputs", nargs="+", help="directories or glob patterns with ECG files"
+    )
+    parser.add_argument(
+        "-o", "--output", required=True, help="consolidated CSV report path"
+    )
+    parser.add_argument(
+        "-w", "--workers", type=int, default=None, help="number of worker processes"
+    )
+    parser.add_argument(
+        "--filter-method",
+        choices=FilterMethods.get_filtering_methods(),
+        default=FilterMethods.BANDPASS.value,
+    )
+    parser.add_argument("--lowcut", type=float, default=None, help="[Hz]")
+    parser.add_argument("--highcut", type=float, default=None, help="[Hz]")
+    parser.add_argument("--filter-order", type=int, default=None)
+    parser.add_argument(
+        "--zero-phase", action="store_true", help="forward-backward filtering"
+    )
+    parser.add_argument(
+        "--detector",
+        choices=available_detectors(),
+        default=DEFAULT_DETECTOR,
+        help="QRS detector, elgendi is the fastest one",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=None,
+        help="directory to cache processing results in, speeds up re-runs",
+    )
+    parser.add_argument(
+        "--dataset",
+        action="store_true",
+        help="write per-beat metrics to a columnar dataset in output directory instead of CSV",
+    )
+    parser.add_argument(
+        "--layout",
+        choices=[x.value for x in ReportLayout],
+        default=ReportLayout.WIDE.value,
+        help="wide - width & area columns per lead with statistics rows, long - a row per lead & annotation",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    args = parse_args(argv)
+
+    files = find_files(args.inputs)
+    processed, failed = run_batch(
+        files,
+        args.output,
+        filter_config_from_args(args),
+        args.workers,
+        args.cache_dir,
+        ReportLayout(args.layout),
+        args.dataset,
+        args.detector,
+    )
+
+    print(f"Processed {processed} files, {failed} failed", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,16 @@
 import logging
 import os
 import tkinter as tk
+from typing import Callable, Optional
 
 import matplotlib
 
+from detectors.registry import create_detector
 from explorer.ECGExplorer import ECGExplorer
+from explorer.processing_cache import ProcessingCache
 from filters.ecg_signal_filter import FilterConfig
 from frontend.app_variables import AppVariables
+from frontend.background_worker import BackgroundWorker
 from frontend.observers.annotations_manager import AnnotationsManager
 from frontend.constants import APP_TITTLE
 from frontend.observers.container_manager import ContainerManager
@@ -22,6 +26,8 @@ logging.basicConfig(level=logging.WARN)
 
 
 class MainApplication(tk.Frame):
+    LOAD_JOB = "load"
+
     def __init__(self, parent, *args, **kwargs):
         tk.Frame.__init__(self, parent, *args, **kwargs)
 
@@ -36,6 +42,8 @@ class MainApplication(tk.Frame):
 
         # ====== app variables ======
         self.app_variables = AppVariables()
+        self.processing_cache = ProcessingCache()
+        self.worker = BackgroundWorker(self)
 
         # ====== frames & widgets ======
 
@@ -47,6 +55,7 @@ class MainApplication(tk.Frame):
             filter_manager=self.filter_manager,
             load_signal_callback=self.load_signal_callback,
             app_variables=self.app_variables,
+            worker=self.worker,
         )
         self.top_frame.pack(fill=tk.BOTH, side=tk.TOP)
 
@@ -64,43 +73,63 @@ class MainApplication(tk.Frame):
             annotations_manager=self.annotations_manager,
             app_variables=self.app_variables,
             close_app_callback=self.exit_main,
+            worker=self.worker,
         )
         self.bottom_frame.pack(side=tk.BOTTOM, fill=tk.BOTH)
 
-    def load_signal_callback(self, filename: str):
+    def load_signal_callback(
+        self,
+        filename: str,
+        on_loaded: Optional[Callable[[], None]] = None,
+        on_error: Optional[Callable[[Exception], None]] = None,
+    ):
         """
-        Entry point, loads signal from a file.
+        Entry point, loads signal from a file. Loading and filtering run in the background worker,
+        jobs of the previously loaded signal are cancelled.
 
         :param filename: ECG filename. Supported files are:
             1. dicom
             2. XML from GE devices
+        :param on_loaded: called once the signal is loaded and displayed
+        :param on_error: called if loading failed
         """
 
         def enable_options_on_signal_load():
             self.top_frame.activate_widgets()
             self.bottom_frame.activate_widgets()
 
-        head, tail = os.path.split(filename)
+        def load(progress) -> ECGExplorer:
+            explorer = ECGExplorer.load_from_file(
+                filename,
+                self.filter_manager.filter_config,
+                self.processing_cache,
+                detector=create_detector(self.app_variables.detector_name),
+            )
+            explorer.process(progress=progress)
+            return explorer
 
-        self.app_variables.file_path = head
-        self.app_variables.file_name = tail.split(".")[0]
+        def on_done(explorer: ECGExplorer):
+            head, tail = os.path.split(filename)
 
-        explorer = ECGExplorer.load_from_file(
-            filename, self.filter_manager.filter_config
-        )
-        self.app_variables.explorer = explorer
+            self.app_variables.file_path = head
+            self.app_variables.file_name = tail.split(".")[0]
+            self.app_variables.explorer = explorer
 
-        explorer.process()
+            container = explorer.container
 
-        container = explorer.container
+            self.leads_manager.set_mapping_from_ecg_container(container)
+            self.annotations_manager.empty_from_ecg_container(container)
+            self.container_manager.container = container
 
-        self.leads_manager.set_mapping_from_ecg_container(container)
-        self.annotations_manager.empty_from_ecg_container(container)
-        self.container_manager.container = container
+            enable_options_on_signal_load()
+            if on_loaded is not None:
+                on_loaded()
 
-        enable_options_on_signal_load()
+        self.worker.cancel_all()
+        self.worker.submit(self.LOAD_JOB, load, on_done=on_done, on_error=on_error)
 
     def exit_main(self):
+        self.worker.shutdown()
         self.parent.destroy()
         exit()
 
@@ -1,11 +1,18 @@
 import logging
+from collections import defaultdict
+from concurrent.futures import Executor
 from enum import Enum
 from dataclasses import dataclass
-from typing import Optional
+from functools import lru_cache, partial
+from typing import Callable, Iterator, Optional
 
+import numpy as np
 from scipy import signal
 
-from models.ecg import ECGContainer, ECGLead
+from models.ecg import ECGContainer, ECGLead, LeadName
+
+# samples per lead filtered at once in chunked mode
+DEFAULT_CHUNK_SIZE = 2**16
 
 
 class FilterMethods(Enum):
@@ -23,6 +30,8 @@ class FilterConfig:
     lowcut_frequency: Optional[float] = None
     highcut_frequency: Optional[float] = None
     filter_order: int = 1.0
+    # forward-backward filtering, no phase distortion
+    zero_phase: bool = False
 
     def __post_init__(self):
         if (
@@ -62,44 +71,159 @@ class EcgSignalFilter:
 
         self.filter_config = config
 
-    def filter(self, ecg: ECGContainer):
+    def filter(
+        self,
+        ecg: ECGContainer,
+        executor: Optional[Executor] = None,
+        progress: Optional[Callable[[LeadName], None]] = None,
+    ):
+        """
+        Leads of the same sampling frequency and length are filtered together, as a single 2D array -
+        usually the container's leads x samples matrix as it is.
+
+        :param executor: optional pool to filter leads concurrently, results are the same as in the serial run.
+        :param progress: called with the lead name whenever a lead is filtered. Filtering stops if it raises,
+            e.g. when cancelled.
+        """
         logging.info(f"Applying filter {self.filter_config}")
+
+        for fs, leads, waveforms in self._group_leads(ecg):
+            if executor:
+                filtered = list(
+                    executor.map(partial(self._do_filter, fs=fs), waveforms)
+                )
+            else:
+                filtered = self._do_filter(waveforms, fs)
+
+            for lead, waveform in zip(leads, filtered):
+                lead.waveform = waveform
+                lead.is_filtered = True
+                if progress is not None:
+                    progress(lead.label)
+
+    def filter_chunks(
+        self,
+        waveforms: np.ndarray[float],
+        fs: float,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ) -> Iterator[np.ndarray[float]]:
+        """
+        Filters very long recordings block by block, carrying the filter state between blocks,
+        so concatenated blocks are exactly the same as the result of `filter`.
+        Only one block of the input is read at a time, so waveforms can be memory-mapped.
+        Zero-phase filtering needs the whole signal and is not supported.
+
+        :param waveforms: single waveform or 2D array of waveforms (lead per row)
+        :return: generator of filtered blocks, `chunk_size` samples each (the last one can be shorter)
+        """
+        if self.filter_config.zero_phase:
+            raise RuntimeError("Zero-phase filtering can't be done in chunks")
+        if chunk_size <= 5:
+            raise RuntimeError("Chunk must be longer than 5 samples")
+
+        sos = self._get_filter_params(fs)
+        # zero initial state, the same as in the one-shot filtering
+        zi = np.zeros((sos.shape[0],) + waveforms.shape[:-1] + (2,))
+
+        for start in range(0, waveforms.shape[-1], chunk_size):
+            chunk = np.asarray(waveforms[..., start : start + chunk_size], dtype=float)
+            filtered, zi = signal.sosfilt(sos, chunk, axis=-1, zi=zi)
+            if start == 0:
+                filtered[..., :5] = filtered[..., 5:6]
+            yield filtered
+
+    def filter_to_file(
+        self,
+        waveforms: np.ndarray[float],
+        fs: float,
+        path: str,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ) -> np.memmap:
+        """
+        Filters in chunks (see `filter_chunks`) into a memory-mapped .npy file, with bounded memory usage.
+
+        :return: filtered waveforms mapped from the file
+        """
+        out = np.lib.format.open_memmap(
+            path, mode="w+", dtype=np.float64, shape=waveforms.shape
+        )
+        start = 0
+        for filtered in self.filter_chunks(waveforms, fs, chunk_size):
+            out[..., start : start + filtered.shape[-1]] = filtered
+            start += filtered.shape[-1]
+
+        out.flush()
+        return out
+
+    @staticmethod
+    def _group_leads(
+        ecg: ECGContainer,
+    ) -> list[tuple[float, list[ECGLead], np.ndarray[float]]]:
+        """
+        :return: sampling frequency, leads and their raw waveforms as 2D array for every group of leads
+        """
+        if ecg.raw_waveforms is not None and len({x.fs for x in ecg.ecg_leads}) == 1:
+            # container's leads x samples matrix, no copying
+            return [(ecg.ecg_leads[0].fs, ecg.ecg_leads, ecg.raw_waveforms)]
+
+        groups: dict[tuple[float, int], list[ECGLead]] = defaultdict(list)
         for lead in ecg.ecg_leads:
-            lead.waveform = self._do_filter(lead)
-            lead.is_filtered = True
+            groups[(lead.fs, lead.raw_waveform.size)].append(lead)
 
-    def _do_filter(self, lead: ECGLead):
-        fs = lead.fs
-        ecg_signal = lead.raw_waveform
+        return [
+            (fs, leads, np.stack([lead.raw_waveform for lead in leads]))
+            for (fs, _), leads in groups.items()
+        ]
 
-        b, a = self._get_filter_params(fs)
-        filtered = signal.lfilter(b, a, ecg_signal)
-        filtered[:5] = filtered[5]
+    def _do_filter(self, waveforms: np.ndarray, fs: float) -> np.ndarray:
+        """
+        :param waveforms: single waveform or 2D array of waveforms (lead per row)
+        """
+        sos = self._get_filter_params(fs)
+
+        if self.filter_config.zero_phase:
+            return signal.sosfiltfilt(sos, waveforms, axis=-1)
+
+        filtered = signal.sosfilt(sos, waveforms, axis=-1)
+        # hide the start-up transient of the causal filter
+        filtered[..., :5] = filtered[..., 5:6]
         return filtered
 
-    def _get_filter_params(self, fs: float) -> tuple[float, float]:
-        nyq = 0.5 * fs
-        lowcut = (
-            self.filter_config.lowcut_frequency / nyq
-            if self.filter_config.lowcut_frequency
-            else None
-        )
-        highcut = (
-            self.filter_config.highcut_frequency / nyq
-            if self.filter_config.highcut_frequency
-            else None
+    def _get_filter_params(self, fs: float) -> np.ndarray:
+        """
+        :return: filter coefficients as second-order sections
+        """
+        return _design_filter(
+            self.filter_config.filter_method,
+            self.filter_config.lowcut_frequency,
+            self.filter_config.highcut_frequency,
+            self.filter_config.filter_order,
+            fs,
         )
-        filter_order = self.filter_config.filter_order
 
-        if self.filter_config.filter_method == FilterMethods.BANDPASS:
-            return signal.butter(filter_order, [lowcut, highcut], btype="bandpass")
 
-        if self.filter_config.filter_method == FilterMethods.LOWPASS:
-            return signal.butter(filter_order, [highcut], btype="lowpass")
-
-        raise RuntimeError(
-            f"Filter method  {self.filter_config.filter_method} not known"
+@lru_cache(maxsize=32)
+def _design_filter(
+    filter_method: FilterMethods,
+    lowcut_frequency: Optional[float],
+    highcut_frequency: Optional[float],
+    filter_order: int,
+    fs: float,
+) -> np.ndarray:
+    nyq = 0.5 * fs
+    lowcut = lowcut_frequency / nyq if lowcut_frequency else None
+    highcut = highcut_frequency / nyq if highcut_frequency else None
+
+    if filter_method == FilterMethods.BANDPASS:
+        sos = signal.butter(
+            filter_order, [lowcut, highcut], btype="bandpass", output="sos"
         )
+    elif filter_method == FilterMethods.LOWPASS:
+        sos = signal.butter(filter_order, [highcut], btype="lowpass", output="sos")
+    else:
+        raise RuntimeError(f"Filter method  {filter_method} not known")
+
+    return sos
 
 
 class FilterInitError(Exception):
@@ -1,4 +1,4 @@
-from typing import Optional, Any
+from typing import Optional, Any, Callable
 
 import numpy as np
 from matplotlib.widgets import Cursor
@@ -42,6 +42,12 @@ class AnnotatedCursor(Cursor):
         So if you use the parameter value "y", ensure that your function is
         biunique.
 
+    sample_value : callable, optional
+        Returns the value of the sample at the given index, or *None* if there
+        is no such sample. If set, the text shows the sample nearest to the
+        pointed x value instead of a point of *line*, e.g. when *line* is
+        a decimated view of the waveform. Only used with *dataaxis* "x".
+
     Other Parameters
     ----------------
     textprops : `matplotlib.text` properties as dictionary
@@ -62,6 +68,7 @@ class AnnotatedCursor(Cursor):
         dataaxis="x",
         textprops=None,
         fs=1,
+        sample_value: Optional[Callable[[int], Optional[float]]] = None,
         **cursorargs,
     ):
         if textprops is None:
@@ -74,6 +81,8 @@ class AnnotatedCursor(Cursor):
         self.offset = np.array(offset)
         # The axis in which the cursor position is looked up
         self.dataaxis = dataaxis
+        # Full resolution lookup of the displayed value
+        self.sample_value = sample_value
 
         # First call baseclass constructor.
         # Draws cursor and remembers background for blitting.
@@ -95,6 +104,12 @@ class AnnotatedCursor(Cursor):
         self.lastdrawnplotpoint = None
         self.fs = fs
 
+        # The cached background no longer matches the axes once it's resized or its limits change,
+        # it's cached again on the following draw of the canvas.
+        self.connect_event("resize_event", self._invalidate_background)
+        self.ax.callbacks.connect("xlim_changed", self._invalidate_background)
+        self.ax.callbacks.connect("ylim_changed", self._invalidate_background)
+
     def onmove(self, event):
         """
         Overridden draw callback for cursor. Called when moving the mouse.
@@ -114,7 +129,16 @@ class AnnotatedCursor(Cursor):
         if event.inaxes != self.ax:
             self.lastdrawnplotpoint = None
             self.text.set_visible(False)
-            super().onmove(event)
+            if self.useblit:
+                # Restore the clean background of this axes only, instead
+                # of the full redraw done by the base class.
+                self.linev.set_visible(False)
+                self.lineh.set_visible(False)
+                if self.needclear:
+                    self._blit()
+                    self.needclear = False
+            else:
+                super().onmove(event)
             return
 
         # Get the coordinates, which should be displayed as text,
@@ -182,12 +206,10 @@ class AnnotatedCursor(Cursor):
         else:
             self.text.set_visible(False)
 
-        # Draw changes. Cannot use _update method of baseclass,
-        # because it would first restore the background, which
-        # is done already and is not necessary.
+        # Draw changes. The _update method of baseclass is skipped,
+        # so cursor lines and text are blitted at once.
         if self.useblit:
-            self.ax.draw_artist(self.text)
-            self.canvas.blit(self.ax.bbox)
+            self._blit()
         else:
             # If blitting is deactivated, the overridden _update call made
             # by the base class immediately returned.
@@ -238,6 +260,12 @@ class AnnotatedCursor(Cursor):
 
         # If position is valid and in valid plot data range.
         if pos is not None and lim[0] <= pos <= lim[-1]:
+            if self.sample_value is not None and self.dataaxis == "x":
+                # The line might hold minimums and maximums of bins, not samples.
+                index = int(round(pos))
+                value = self.sample_value(index)
+                return None if value is None else (index, value)
+
             # Find closest x value in sorted x vector.
             # This requires the plotted data to be sorted.
             index = np.searchsorted(data, pos)
@@ -262,17 +290,43 @@ class AnnotatedCursor(Cursor):
         if self.ignore(event):
             return
         self.text.set_visible(False)
+        # The cursor isn't part of the drawn canvas, draw it on the next move
+        self.lastdrawnplotpoint = None
+
+    def _invalidate_background(self, *_):
+        self.background = None
+
+    def _blit(self):
+        """
+        Restore the cached background of the axes and draw the animated artists only -
+        cursor lines, text and the artists of other widgets, e.g. span selector.
+        """
+        if self.background is None:
+            # Wait for the canvas to be drawn and the background to be cached again.
+            return
+
+        own_artists = [self.linev, self.lineh, self.text]
+        artists = [
+            x for x in self.ax.get_children() if x.get_animated() and x.get_visible()
+        ]
+
+        self.canvas.restore_region(self.background)
+        for artist in sorted(artists, key=lambda x: x.get_zorder()):
+            self.ax.draw_artist(artist)
+        self.canvas.blit(self.ax.bbox)
+
+        # The cursor stays on the screen until the next blit, but has to be hidden from full draws
+        # of the canvas, otherwise widgets redraw the canvas again to cache a clean background.
+        for artist in own_artists:
+            artist.set_visible(False)
 
     def _update(self):
         """
         Overridden method for either blitting or drawing the widget canvas.
 
-        Passes call to base class if blitting is activated, only.
-        In other cases, one draw_idle call is enough, which is placed
-        explicitly in this class (see *onmove()*).
-        In that case, `~matplotlib.widgets.Cursor` is not supposed to draw
+        Does nothing, blitting or one draw_idle call is placed
+        explicitly in this class (see *onmove()*), so cursor lines and text
+        are drawn at once.
+        `~matplotlib.widgets.Cursor` is not supposed to draw
         something using this method.
         """
-
-        if self.useblit:
-            super()._update()
@@ -1,6 +1,7 @@
 from dataclasses import dataclass
 from typing import Optional
 
+from detectors.registry import DEFAULT_DETECTOR
 from explorer.ECGExplorer import ECGExplorer
 
 
@@ -14,3 +15,5 @@ class AppVariables:
     file_path: Optional[str] = None
     file_name: Optional[str] = None
     explorer: Optional[ECGExplorer] = None
+    # QRS detector selected by the user, see `detectors.registry`
+    detector_name: str = DEFAULT_DETECTOR
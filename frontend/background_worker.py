@@ -0,0 +1,201 @@
+import logging
+import queue
+import threading
+import tkinter as tk
+from concurrent.futures import ThreadPoolExecutor
+from enum import Enum
+from typing import Any, Callable, Optional
+
+from frontend.observers.observer_abc import Subject
+
+
+class JobCancelled(Exception):
+    """
+    Raised from the job's progress callback once the job is cancelled, it stops the computation.
+    """
+
+
+class WorkerEvents(Enum):
+    BUSY_UPDATE = 1
+
+
+class JobEvents(Enum):
+    PROGRESS = 1
+    DONE = 2
+    ERROR = 3
+
+
+class Job:
+    def __init__(
+        self,
+        key: str,
+        fn: Callable[..., Any],
+        on_done: Optional[Callable[[Any], None]] = None,
+        on_progress: Optional[Callable[..., None]] = None,
+        on_error: Optional[Callable[[Exception], None]] = None,
+    ):
+        self.key = key
+        self.fn = fn
+        self.on_done = on_done
+        self.on_progress = on_progress
+        self.on_error = on_error
+        self._cancelled = threading.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        """
+        Callbacks of a cancelled job are never called. If it's running, it stops on the next progress report.
+        """
+        self._cancelled.set()
+
+
+class BackgroundWorker(Subject):
+    """
+    Runs long jobs - loading, filtering and QRS detection - in a background thread, so the UI stays responsive.
+    Jobs are run one at a time, in order of submission, since they share the explorer and its container.
+
+    The worker thread never touches Tk: job's progress and result are queued, and polled with `after()`
+    from the Tk main loop, where the job's callbacks are called.
+    Subscribers are notified whenever the worker becomes busy or idle, e.g. to disable widgets that read
+    the container while a job may modify it.
+    """
+
+    POLL_INTERVAL_MS = 50
+
+    def __init__(self, widget: tk.Misc):
+        """
+        :param widget: any widget, used to schedule polling in the Tk main loop
+        """
+        super().__init__()
+        self.widget = widget
+
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._events: queue.Queue[tuple[JobEvents, Job, tuple]] = queue.Queue()
+        # submitted jobs that haven't finished yet, the latest one per key
+        self._jobs: dict[str, Job] = {}
+        self._poll_id: Optional[str] = None
+        self._busy = False
+
+    def submit(
+        self,
+        key: str,
+        fn: Callable[..., Any],
+        on_done: Optional[Callable[[Any], None]] = None,
+        on_progress: Optional[Callable[..., None]] = None,
+        on_error: Optional[Callable[[Exception], None]] = None,
+    ) -> Job:
+        """
+        Requests with the same key are coalesced - a previous job of this key is cancelled, only the latest
+        one calls its callbacks, e.g. rapid filter setting changes end up with the last settings applied.
+
+        :param fn: called in the worker thread with `progress` keyword argument. Calling `progress`
+            with any arguments calls `on_progress` with them in the main thread, and raises `JobCancelled`
+            once the job is cancelled.
+        :param on_done: called with the result of `fn`
+        :param on_error: called with the exception raised by `fn`. If not set, the exception is raised
+            in the main loop, the same as from any other Tk callback.
+        """
+        self._cancel(key)
+
+        job = Job(key, fn, on_done, on_progress, on_error)
+        self._jobs[key] = job
+        self._executor.submit(self._run, job)
+        self._schedule_poll()
+        self._notify_busy()
+
+        return job
+
+    def cancel(self, key: str):
+        self._cancel(key)
+        self._notify_busy()
+
+    def cancel_all(self):
+        for key in list(self._jobs):
+            self._cancel(key)
+        self._notify_busy()
+
+    def is_running(self, key: str) -> bool:
+        return key in self._jobs
+
+    @property
+    def busy(self) -> bool:
+        return bool(self._jobs)
+
+    def shutdown(self):
+        self.cancel_all()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        if self._poll_id is not None:
+            self.widget.after_cancel(self._poll_id)
+            self._poll_id = None
+
+    def _cancel(self, key: str):
+        job = self._jobs.pop(key, None)
+        if job is not None:
+            logging.info(f"Cancelling {key} job")
+            job.cancel()
+
+    def _run(self, job: Job):
+        if job.cancelled:
+            return
+
+        def progress(*args):
+            if job.cancelled:
+                raise JobCancelled()
+            self._events.put((JobEvents.PROGRESS, job, args))
+
+        try:
+            result = job.fn(progress=progress)
+        except JobCancelled:
+            logging.info(f"Job {job.key} cancelled")
+            return
+        except Exception as e:
+            self._events.put((JobEvents.ERROR, job, (e,)))
+            return
+
+        self._events.put((JobEvents.DONE, job, (result,)))
+
+    def _schedule_poll(self):
+        if self._poll_id is None:
+            self._poll_id = self.widget.after(self.POLL_INTERVAL_MS, self._poll)
+
+    def _poll(self):
+        self._poll_id = None
+
+        events = []
+        while not self._events.empty():
+            events.append(self._events.get_nowait())
+
+        # keep polling as long as there are jobs to wait for
+        finished = [job for event, job, _ in events if event != JobEvents.PROGRESS]
+        for job in finished:
+            if self._jobs.get(job.key) is job:
+                del self._jobs[job.key]
+        if self._jobs:
+            self._schedule_poll()
+
+        try:
+            for event, job, args in events:
+                if job.cancelled:
+                    continue
+
+                if event == JobEvents.PROGRESS:
+                    if job.on_progress is not None:
+                        job.on_progress(*args)
+                elif event == JobEvents.DONE:
+                    if job.on_done is not None:
+                        job.on_done(*args)
+                elif job.on_error is not None:
+                    job.on_error(*args)
+                else:
+                    raise args[0]
+        finally:
+            # after callbacks, e.g. widgets are enabled once the loaded signal is set
+            self._notify_busy()
+
+    def _notify_busy(self):
+        if self.busy != self._busy:
+            self._busy = self.busy
+            self.notify_subscribers(event=WorkerEvents.BUSY_UPDATE, busy=self._busy)
@@ -1,11 +1,20 @@
 from dataclasses import dataclass
+from typing import Optional
 
 from matplotlib import pyplot as plt
 from matplotlib.widgets import SpanSelector
 
+from frontend.waveform_lod import MinMaxPyramid
+from models.ecg import ECGLead
+
 
 @dataclass
 class AxProperties:
     ax: plt.Axes
     line: plt.Line2D
     span_selector: SpanSelector
+    lead: Optional[ECGLead] = None
+    # plotted waveform, line data is its visible range at screen resolution
+    waveform_lod: Optional[MinMaxPyramid] = None
+    # waveform units to plot units
+    y_scale: float = 1.0
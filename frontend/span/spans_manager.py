@@ -1,16 +1,30 @@
-from typing import List
-from frontend.span.span import Span
+from typing import Callable, List, Optional
+
 import matplotlib.pyplot as plt
+import numpy as np
+from matplotlib.backend_bases import MouseEvent
+from matplotlib.collections import PolyCollection
 
+from frontend.span.span import Span
 from models.annotation import QRSComplex
 
 
 class SpanManager:
     """
     Manages the visualization and interaction of spans on a single matplotlib Axes.
+
+    All spans are drawn as one PolyCollection, highlighting is done with its per-span face colors.
+    Hit-testing and dragging of span edges is handled once for the whole Axes.
     """
 
-    def __init__(self, ax: plt.Axes):
+    FACECOLOR = (1, 0, 0, 0.5)
+    HIGHLIGHT_FACECOLOR = (0, 1, 0, 0.5)
+
+    def __init__(
+        self,
+        ax: plt.Axes,
+        on_span_changed: Optional[Callable[[int, float, float], None]] = None,
+    ):
         """
         Initialize the SpanManager for a given Axes.
 
@@ -18,10 +32,31 @@ class SpanManager:
         ----------
         ax : matplotlib.axes.Axes
             The matplotlib Axes on which spans will be managed.
+        on_span_changed : callable, optional
+            Called with span index, onset and offset when a span was dragged.
         """
         self.ax = ax
+        self.on_span_changed = on_span_changed
         self.spans: List[Span] = []  # List to hold all managed spans
 
+        # spans cover the whole height of the Axes, x in data coordinates
+        self.collection = PolyCollection(
+            [], transform=ax.get_xaxis_transform(), linewidths=0
+        )
+        ax.add_collection(self.collection, autolim=False)
+
+        # index of the dragged span, its edge being moved and the last mouse position
+        self._drag_index: Optional[int] = None
+        self._drag_edge: Optional[str] = None
+        self._drag_start: Optional[float] = None
+
+        canvas = ax.figure.canvas
+        self._cids = [
+            canvas.mpl_connect("button_press_event", self._on_press),
+            canvas.mpl_connect("motion_notify_event", self._on_motion),
+            canvas.mpl_connect("button_release_event", self._on_release),
+        ]
+
     def add_span(self, onset: int, offset: int) -> Span:
         """
         Add a new span to the plot and display it.
@@ -37,9 +72,9 @@ class SpanManager:
         Span
             The created Span object.
         """
-        span = Span(onset, offset, self.ax)
-        span.set_draggable(self.ax)  # Enable interactivity
+        span = self._create_span(onset, offset)
         self.spans.append(span)
+        self._update_collection()
         return span
 
     def remove_span_by_index(self, index: int):
@@ -51,16 +86,26 @@ class SpanManager:
         index : int
             Index of span to be removed.
         """
-
-        self.spans.pop(index).remove_artist()
+        self.spans.pop(index)._on_change = None
+        self._update_collection()
 
     def clear_spans(self):
         """
         Clear all spans from the plot and reset the internal list.
         """
         for span in self.spans:
-            span.remove_artist()
+            span._on_change = None
         self.spans.clear()
+        self._update_collection()
+
+    def remove(self):
+        """
+        Remove the collection and event handlers, the manager can't be used afterwards.
+        """
+        self.clear_spans()
+        for cid in self._cids:
+            self.ax.figure.canvas.mpl_disconnect(cid)
+        self.collection.remove()
 
     def synchronize_with_data(self, spans_data: List[QRSComplex]):
         """
@@ -68,12 +113,13 @@ class SpanManager:
 
         Parameters
         ----------
-        spans_data : List[Span]
-            A list of Span objects to synchronize with.
+        spans_data : List[QRSComplex]
+            A list of QRS complexes to synchronize with.
         """
-        self.clear_spans()  # Remove existing spans
-        for data_span in spans_data:
-            self.add_span(data_span.onset, data_span.offset)
+        for span in self.spans:
+            span._on_change = None
+        self.spans = [self._create_span(x.onset, x.offset) for x in spans_data]
+        self._update_collection()
         self.ax.figure.canvas.draw_idle()  # Redraw the canvas to reflect changes
 
     def get_spans(self) -> List[Span]:
@@ -86,3 +132,88 @@ class SpanManager:
             A list of all managed Span objects.
         """
         return self.spans
+
+    @property
+    def is_dragging(self) -> bool:
+        """
+        Whether an edge of a span is being dragged, from the button press to its release.
+        """
+        return self._drag_index is not None
+
+    def span_index_at(self, x: float) -> Optional[int]:
+        """
+        Find the span containing given position.
+
+        Parameters
+        ----------
+        x : float
+            Position in X-axis units.
+        Returns
+        -------
+        int or None
+            Index of the first span containing the position, None if there's no such span.
+        """
+        onsets, offsets = self._bounds()
+        indices = np.flatnonzero((onsets <= x) & (x <= offsets))
+        return int(indices[0]) if indices.size else None
+
+    def _create_span(self, onset: int, offset: int) -> Span:
+        return Span(onset, offset, _on_change=self._update_collection)
+
+    def _bounds(self) -> tuple[np.ndarray, np.ndarray]:
+        bounds = np.array([(x.onset, x.offset) for x in self.spans], dtype=float)
+        bounds = bounds.reshape(-1, 2)
+        return bounds[:, 0], bounds[:, 1]
+
+    def _update_collection(self):
+        onsets, offsets = self._bounds()
+
+        verts = np.empty((onsets.size, 4, 2))
+        verts[:, :, 0] = np.column_stack([onsets, onsets, offsets, offsets])
+        verts[:, :, 1] = [0, 1, 1, 0]
+        self.collection.set_verts(verts)
+
+        highlighted = np.array([x.is_highlighted for x in self.spans], dtype=bool)
+        facecolors = np.tile(self.FACECOLOR, (len(self.spans), 1))
+        facecolors[highlighted] = self.HIGHLIGHT_FACECOLOR
+        self.collection.set_facecolors(facecolors)
+
+    def _on_press(self, event: MouseEvent):
+        if event.inaxes != self.ax or event.xdata is None:
+            return
+
+        index = self.span_index_at(event.xdata)
+        if index is None:
+            return
+
+        span = self.spans[index]
+        self._drag_index = index
+        self._drag_start = event.xdata
+        self._drag_edge = (
+            "left"
+            if abs(event.xdata - span.onset) < abs(event.xdata - span.offset)
+            else "right"
+        )
+
+    def _on_motion(self, event: MouseEvent):
+        if self._drag_index is None or event.inaxes != self.ax or event.xdata is None:
+            return
+
+        span = self.spans[self._drag_index]
+        dx = event.xdata - self._drag_start
+        self._drag_start = event.xdata
+        if self._drag_edge == "left":
+            span.update(span.onset + dx, span.offset)
+        else:
+            span.update(span.onset, span.offset + dx)
+        self.ax.figure.canvas.draw_idle()
+
+    def _on_release(self, event: MouseEvent):
+        if self._drag_index is None:
+            return
+
+        index = self._drag_index
+        self._drag_index, self._drag_edge, self._drag_start = None, None, None
+        if self.on_span_changed is not None and index < len(self.spans):
+            span = self.spans[index]
+            self.on_span_changed(index, span.onset, span.offset)
@@ -1,15 +1,18 @@
 import tkinter as tk
+from enum import Enum
 from tkinter import filedialog as fd
 from tkinter.messagebox import showinfo
 from typing import Callable
 
 from frontend.app_variables import AppVariables
+from frontend.background_worker import BackgroundWorker, WorkerEvents
 from frontend.constants import APP_TITTLE
 from frontend.observers.annotations_manager import AnnotationsManager
+from frontend.observers.observer_abc import Observer
 
 
 # TODO: this
-class BottomFrame(tk.Frame):
+class BottomFrame(tk.Frame, Observer):
     def __init__(
         self,
         parent: tk.Frame,
@@ -17,6 +20,7 @@ class BottomFrame(tk.Frame):
         app_variables: AppVariables,
         # we need access to "master" parent to close it, this is why want this as a callback
         close_app_callback: Callable,
+        worker: BackgroundWorker,
         *args,
         **kwargs,
     ):
@@ -25,6 +29,9 @@ class BottomFrame(tk.Frame):
         self.parent = parent
         self.app_variables = app_variables
         self.annotations_manager = annotations_manager
+        self.worker = worker
+        # report and annotations read the container, which a running job may modify
+        self.worker.add_subscriber(self)
 
         self.save_annotations_button = tk.Button(
             self,
@@ -74,20 +81,31 @@ class BottomFrame(tk.Frame):
         )
 
     def _on_save_annotations(self):
-        filename = fd.asksaveasfile(
-            mode="w",
+        # only the name is asked for, opening the file would truncate it before annotations are saved
+        filename = fd.asksaveasfilename(
             initialfile=f"{self.app_variables.file_name}.annx",
             defaultextension=".annx",
         )
 
-        if filename is None:
+        if not filename:
             return
 
         self._override_qrs_complexes_from_annotations()
-        self.app_variables.explorer.save_annotations(filename.name)
+        self.app_variables.explorer.save_annotations(filename)
+
+        showinfo(title=APP_TITTLE, message=f"Annotations saved to {filename}")
+
+    def update_on_notification(self, event: Enum, *args, **kwargs):
+        if (
+            event == WorkerEvents.BUSY_UPDATE
+            and self.app_variables.explorer is not None
+        ):
+            self._set_widgets_state(kwargs["busy"])
 
-        showinfo(title=APP_TITTLE, message=f"Annotations saved to {filename.name}")
+    def _set_widgets_state(self, busy: bool):
+        state = tk.DISABLED if busy else tk.NORMAL
+        self.generate_report_button.configure(state=state)
+        self.save_annotations_button.configure(state=state)
 
     def activate_widgets(self):
-        self.generate_report_button.configure(state=tk.NORMAL)
-        self.save_annotations_button.configure(state=tk.NORMAL)
+        self._set_widgets_state(self.worker.busy)
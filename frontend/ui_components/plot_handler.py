@@ -1,5 +1,6 @@
 import logging
 import math
+from functools import partial
 import tkinter as tk
 from enum import Enum
 
@@ -11,6 +12,7 @@ from tkinter import messagebox
 from matplotlib.backend_bases import MouseEvent, KeyEvent
 from matplotlib.backends._backend_tk import NavigationToolbar2Tk
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+from matplotlib.gridspec import SubplotSpec
 from matplotlib.ticker import AutoMinorLocator, MultipleLocator
 from matplotlib.widgets import SpanSelector, Cursor
 
@@ -22,9 +24,9 @@ from frontend.observers.filter_config_manager import FilterManager, FilterEvents
 from frontend.observers.leads_manager import LeadsManager, LeadEvents
 from frontend.models import AxProperties
 from frontend.observers.observer_abc import Observer
-from frontend.span.span import Span
 from frontend.span.spans_manager import SpanManager
 from frontend.utils import do_annotations_overlap
+from frontend.waveform_lod import MinMaxPyramid
 from models.annotation import QRSComplex
 from models.ecg import LeadName, ECGLead
 
@@ -69,12 +71,16 @@ class ECGPlotHandler(tk.Frame, Observer):
         self.ax_properties: dict[LeadName, AxProperties] = {}
         self.span_managers: dict[LeadName, SpanManager] = {}
         self.cursors: dict[str, Cursor] = {}
+        # built once per lead and signal type (raw or processed), reused by redraws
+        self.waveform_lods: dict[tuple[LeadName, bool], MinMaxPyramid] = {}
 
         # mouse event that helps to handle actions when a span is selected
         self.mouse_event: Optional[MouseEvent] = None
 
         self.canvas.mpl_connect("button_press_event", self._select_and_highlight_span)
         self.canvas.mpl_connect("key_press_event", self._handle_key_press_event)
+        # axes width changes, so does the resolution of the plotted waveforms
+        self.canvas.mpl_connect("resize_event", self._update_lines_on_resize)
 
     @classmethod
     def empty(
@@ -100,29 +106,24 @@ class ECGPlotHandler(tk.Frame, Observer):
         logging.info(f"Received {event.name} event in ECGPlotHandler")
 
         if event == ContainerEvents.CONTAINER_UPDATE:
-            self._update_plot()
+            # leads might be new objects, or the same ones with re-processed waveforms
+            self.waveform_lods.clear()
+            self._update_selected_leads()
+            self._update_waveforms()
 
         if event == FilterEvents.DISPLAY_CONFIG_UPDATE:
-            self._update_plot()
+            self._update_waveforms()
 
         if event == AnnotationEvents.ANNOTATIONS_UPDATE:
-            # remove existing span artists and draw new ones
-            self._update_plot()
+            self.synchronize_spans_with_annotations()
+            self.canvas.draw_idle()
 
         if event == AnnotationEvents.ANNOTATIONS_DELETE:
             # just re-draw waveform
             self._clear_all_spans()
 
         if event == LeadEvents.LEADS_SELECTION_UPDATE:
-            self._update_plot()
-
-    def _update_plot(self):
-        """
-       Recreate subplots for selected leads and synchronize spans with annotations.
-       """
-        self.plot_waveforms_for_selected_leads()
-        self.synchronize_spans_with_annotations()
-        self.canvas.draw_idle()
+            self._update_selected_leads()
 
     def _clear_all_spans(self):
         """
@@ -141,16 +142,35 @@ class ECGPlotHandler(tk.Frame, Observer):
             if lead in self.span_managers:
                 self.span_managers[lead].synchronize_with_data(annotations)
 
-    def plot_waveforms_for_selected_leads(self):
+    def _update_selected_leads(self):
+        """
+        Adds subplots of newly selected leads and removes these of deselected ones, subplots of leads
+        that stay selected are only moved if the grid changes.
+        """
         leads = self.leads_manager.selected_leads
-        show_processed_signal = self.filter_manager.show_filtered
+        selected = {x.label: x for x in leads}
+
+        removed = [
+            lead_name
+            for lead_name, ax_props in self.ax_properties.items()
+            if selected.get(lead_name) is not ax_props.lead
+        ]
+        for lead_name in removed:
+            self._remove_axes(lead_name)
+        # new axes share x with the kept ones, so x range is set only if no axes were kept
+        set_x_range = not self.ax_properties
 
-        self._create_subplots(leads)
+        added = [x for x in leads if x.label not in self.ax_properties]
+        if not removed and not added and list(self.ax_properties) == list(selected):
+            return
 
-        self.cursors.clear()
-        for lead_name, ax_props in self.ax_properties.items():
-            lead = self.leads_manager.get_lead(lead_name)
-            self._plot_waveform(lead, ax_props.ax, ax_props.line, show_processed_signal)
+        self._arrange_subplots(leads)
+
+        show_processed_signal = self.filter_manager.show_filtered
+        for lead in added:
+            ax_props = self.ax_properties[lead.label]
+            self._plot_waveform(lead, ax_props, show_processed_signal, set_x_range)
+            set_x_range = False
 
             cursor = AnnotatedCursor(
                 line=ax_props.line,
@@ -159,21 +179,45 @@ class ECGPlotHandler(tk.Frame, Observer):
                 dataaxis="x",
                 offset=[10, 10],
                 textprops={"color": "black", "fontweight": "normal"},
-                useblit=False,
+                useblit=True,
                 color="grey",
                 linewidth=1,
                 fs=lead.fs,
+                sample_value=partial(self._sample_value, lead.label),
             )
             self.cursors[lead.label] = cursor
 
-            self.span_managers[lead.label] = SpanManager(ax_props.ax)
+            self.span_managers[lead.label] = SpanManager(
+                ax_props.ax, partial(self._on_span_dragged, lead.label)
+            )
+            self.span_managers[lead.label].synchronize_with_data(
+                self.annotations_manager.annotations.get(lead.label, [])
+            )
 
         self.canvas.draw_idle()
         self.canvas.get_tk_widget().pack(**self.ECG_PLOT_PACK_CONFIG)
 
+    def _update_waveforms(self):
+        """
+        Swaps plotted waveforms (raw or processed) of all subplots, nothing else is re-created.
+        """
+        show_processed_signal = self.filter_manager.show_filtered
+        for ax_props in self.ax_properties.values():
+            self._plot_waveform(
+                ax_props.lead, ax_props, show_processed_signal, set_x_range=False
+            )
+
+        self.canvas.draw_idle()
+
     def _on_select_with_axes(self, ax: plt.Axes):
         def on_select(*positions: (float, float)):
             lead_name = ax.get_title()
+            # span selector also follows the mouse while an edge of a span is dragged,
+            # the dragged span is updated by its SpanManager then
+            span_manager = self.span_managers.get(lead_name)
+            if span_manager is not None and span_manager.is_dragging:
+                return
+
             ax_props = self.ax_properties[lead_name]
             self._set_selected_span(lead_name, ax_props.ax, *positions)
 
@@ -215,96 +259,181 @@ class ECGPlotHandler(tk.Frame, Observer):
             self.annotations_manager.annotations[lead.label][overlapping.index(True)] = qrs_complex
             self.span_managers[lead.label].spans[overlapping.index(True)].update(onset, offset)
         else:
-            span = Span(onset, offset, ax)
             self.annotations_manager.annotations[lead.label].append(qrs_complex)
-            self.span_managers[lead.label].spans.append(span)
+            self.span_managers[lead.label].add_span(onset, offset)
 
         self.canvas.draw_idle()
 
-    def _create_subplots(self, leads: list[ECGLead]):
-        self.fig.clear()
-        self.ax_properties.clear()
-        self.span_managers.clear()
-
+    def _arrange_subplots(self, leads: list[ECGLead]):
+        """
+        Places subplots of leads in a grid, in order of leads. Subplots that don't exist yet are created.
+        """
         n_subplots = len(leads) if leads else 1
         n_columns = 2 if n_subplots > 3 else 1
         n_rows = math.ceil(n_subplots / n_columns)
+        grid = self.fig.add_gridspec(n_rows, n_columns)
 
-        # axes: dict[LeadName, AxProperties] = {}
+        # subplots share x axis, so new ones get the current zoom of the existing ones
+        shared_ax = next((x.ax for x in self.ax_properties.values()), None)
 
+        ax_properties: dict[LeadName, AxProperties] = {}
         for i, lead in enumerate(leads):
-            ax = self.fig.add_subplot(n_rows, n_columns, i + 1)
+            if lead.label in self.ax_properties:
+                ax_props = self.ax_properties[lead.label]
+                ax_props.ax.set_subplotspec(grid[i])
+            else:
+                ax_props = self._create_subplot(lead, grid[i], shared_ax)
+                shared_ax = shared_ax or ax_props.ax
+            ax_properties[lead.label] = ax_props
+        self.ax_properties = ax_properties
+
+        # tick labels of inner subplots are hidden, but these might be outer ones now
+        for ax_props in self.ax_properties.values():
+            ax = ax_props.ax
+            ax.xaxis.set_tick_params(which="both", labelbottom=True)
+            ax.yaxis.set_tick_params(which="both", labelleft=True)
+            ax.xaxis.label.set_visible(True)
+            ax.yaxis.label.set_visible(True)
+            ax.label_outer()
+
+        # need to set tight layout after each change of the grid
+        self.fig.tight_layout()
 
-            if i > 0:
-                ax.sharex(list(self.ax_properties.values())[0].ax)
+    def _create_subplot(
+        self, lead: ECGLead, subplot_spec: SubplotSpec, shared_ax: Optional[plt.Axes]
+    ) -> AxProperties:
+        ax = self.fig.add_subplot(subplot_spec)
+        if shared_ax is not None:
+            ax.sharex(shared_ax)
+
+        (line,) = ax.plot([], [])
+
+        span_selector = SpanSelector(
+            ax,
+            self._on_select_with_axes(ax),
+            direction="horizontal",
+            useblit=True,
+            props=dict(alpha=0.5, facecolor="red"),
+            interactive=True,
+            minspan=10,
+        )
+        ax.callbacks.connect("xlim_changed", self._update_line_for_xlim)
 
-            (line,) = ax.plot([], [])
+        ax.xaxis.set_tick_params(labelsize=9)
+        ax.yaxis.set_tick_params(labelsize=9)
+        ax.xaxis.set_minor_locator(AutoMinorLocator(5))
+        ax.yaxis.set_minor_locator(MultipleLocator(0.1))
 
-            span_selector = SpanSelector(
-                ax,
-                self._on_select_with_axes(ax),
-                direction="horizontal",
-                useblit=True,
-                props=dict(alpha=0.5, facecolor="red"),
-                interactive=True,
-                minspan=10,
-            )
+        ax.grid(which="major", linestyle="-", linewidth="0.5", color="red")
+        ax.grid(which="minor", linestyle="-", linewidth="0.5", color=(1, 0.7, 0.7))
 
-            self.ax_properties[lead.label] = AxProperties(ax, line, span_selector)
+        ax.set_title(f"{lead.label}", x=0.01, y=0.9, transform=ax.transAxes, ha="left")
+        ax.set_ylabel(f"mV", fontsize=10)
+        ax.set_xlabel(f"seconds", fontsize=10)
 
-        # need to set tight layout after each fig redrawing
-        self.fig.tight_layout()
+        return AxProperties(ax, line, span_selector, lead)
+
+    def _remove_axes(self, lead_name: LeadName):
+        ax_props = self.ax_properties.pop(lead_name)
+        ax_props.span_selector.disconnect_events()
+
+        cursor = self.cursors.pop(lead_name, None)
+        if cursor is not None:
+            cursor.disconnect_events()
+
+        span_manager = self.span_managers.pop(lead_name, None)
+        if span_manager is not None:
+            span_manager.remove()
+
+        ax_props.ax.remove()
 
     def _plot_waveform(
         self,
         lead: ECGLead,
-        ax: plt.Axes,
-        line: plt.Line2D,
+        ax_props: AxProperties,
         show_processed_signal: bool = False,
+        set_x_range: bool = True,
     ):
+        """
+        :param set_x_range: set x ticks and show the whole waveform, otherwise current zoom is kept.
+            Ticks and limits of x axis are shared by all subplots.
+        """
+        ax = ax_props.ax
         waveform = lead.waveform if show_processed_signal else lead.raw_waveform
 
         # scale to milli-volts
         if lead.units == "uV":
-            waveform = waveform / 1000
+            ax_props.y_scale = 1 / 1000
         else:
             raise RuntimeError("Unit not known")
 
-        line.set_data(range(len(waveform)), waveform)
-
-        x = np.arange(0, len(waveform), self.X_ECG_GRID_IN_MS * lead.fs / 1000)
-        x_ticks = x / lead.fs
-        ax.set_xticks(x)
-        ax.set_xlim(0, len(waveform))
-        ax.set_xticklabels(x_ticks)
-        ax.xaxis.set_tick_params(labelsize=9)
+        lod_key = (lead.label, show_processed_signal)
+        if (
+            lod_key not in self.waveform_lods
+            or self.waveform_lods[lod_key].waveform is not waveform
+        ):
+            self.waveform_lods[lod_key] = MinMaxPyramid(waveform)
+        ax_props.waveform_lod = self.waveform_lods[lod_key]
+        y_min = ax_props.waveform_lod.min * ax_props.y_scale
+        y_max = ax_props.waveform_lod.max * ax_props.y_scale
+
+        if set_x_range:
+            x = np.arange(0, len(waveform), self.X_ECG_GRID_IN_MS * lead.fs / 1000)
+            x_ticks = x / lead.fs
+            ax.set_xticks(x)
+            ax.set_xlim(0, len(waveform))
+            ax.set_xticklabels(x_ticks)
+        self._update_line_for_xlim(ax)
 
         y_min_round_half_down = (
-            round(
-                (min(waveform) - (0.5 if (abs(min(waveform)) * 2 % 1) < 0.5 else 0)) * 2
-            )
-            / 2
+            round((y_min - (0.5 if (abs(y_min) * 2 % 1) < 0.5 else 0)) * 2) / 2
         )
         y_max_round_half_up = (
-            round((max(waveform) + (0.5 if (max(waveform) * 2 % 1) < 0.5 else 0)) * 2)
-            / 2
+            round((y_max + (0.5 if (y_max * 2 % 1) < 0.5 else 0)) * 2) / 2
         )
 
         y = np.arange(y_min_round_half_down - 1, y_max_round_half_up + 1, 0.5)
         ax.set_yticks(y)
         ax.set_ylim(y_min_round_half_down - 0.1, y_max_round_half_up + 0.1)
-        ax.yaxis.set_tick_params(labelsize=9)
 
-        ax.xaxis.set_minor_locator(AutoMinorLocator(5))
-        ax.yaxis.set_minor_locator(MultipleLocator(0.1))
+    def _on_span_dragged(
+        self, lead_name: LeadName, index: int, onset: float, offset: float
+    ):
+        self.annotations_manager.annotations[lead_name][index] = QRSComplex(
+            int(round(onset)), int(round(offset))
+        )
+        # drop the selection made by the span selector along with the drag
+        self.ax_properties[lead_name].span_selector.clear()
 
-        ax.grid(which="major", linestyle="-", linewidth="0.5", color="red")
-        ax.grid(which="minor", linestyle="-", linewidth="0.5", color=(1, 0.7, 0.7))
+    def _update_line_for_xlim(self, ax: plt.Axes):
+        """
+        Re-samples the visible range of the waveform to at most twice the axes width in pixels,
+        so drawing cost doesn't depend on the record length.
+        """
+        ax_props = next((x for x in self.ax_properties.values() if x.ax is ax), None)
+        if ax_props is None or ax_props.waveform_lod is None:
+            return
 
-        ax.set_title(f"{lead.label}", x=0.01, y=0.9, transform=ax.transAxes, ha="left")
-        ax.set_ylabel(f"mV", fontsize=10)
-        ax.set_xlabel(f"seconds", fontsize=10)
-        ax.label_outer()
+        start, stop = ax.get_xlim()
+        x, y = ax_props.waveform_lod.view(start, stop, max(2 * int(ax.bbox.width), 2))
+        ax_props.line.set_data(x, y * ax_props.y_scale)
+
+    def _sample_value(self, lead_name: LeadName, index: int) -> Optional[float]:
+        """
+        Value of the plotted waveform at full resolution, the line might hold decimated minimums and maximums.
+        """
+        ax_props = self.ax_properties.get(lead_name)
+        if ax_props is None or ax_props.waveform_lod is None:
+            return None
+
+        waveform = ax_props.waveform_lod.waveform
+        if not 0 <= index < waveform.size:
+            return None
+        return waveform[index] * ax_props.y_scale
+
+    def _update_lines_on_resize(self, _):
+        for ax_props in self.ax_properties.values():
+            self._update_line_for_xlim(ax_props.ax)
 
     def _select_and_highlight_span(self, event: tk.Event):
         """
@@ -331,13 +460,14 @@ class ECGPlotHandler(tk.Frame, Observer):
         for lead, manager in self.span_managers.items():
             if manager.ax == ax:
                 # Find the span under the mouse cursor
-                for span in manager.get_spans():
-                    if span.onset <= event.xdata <= span.offset:
-                        if span.is_highlighted:
-                            span.remove_highlight()
-                            self.mouse_event = None
-                        else:
-                            span.highlight()
+                index = manager.span_index_at(event.xdata)
+                if index is not None:
+                    span = manager.spans[index]
+                    if span.is_highlighted:
+                        span.remove_highlight()
+                        self.mouse_event = None
+                    else:
+                        span.highlight()
 
         self.canvas.draw_idle()
 
@@ -359,10 +489,9 @@ class ECGPlotHandler(tk.Frame, Observer):
         if len(self.span_managers[selected_lead].spans) == 0:
             return
 
-        for cnt, pos in enumerate(self.span_managers[selected_lead].spans):
-            if pos.onset < self.mouse_event.xdata < pos.offset:
-                i = cnt
-                break
+        i = self.span_managers[selected_lead].span_index_at(self.mouse_event.xdata)
+        if i is None:
+            return
 
         self.span_managers[selected_lead].remove_span_by_index(i)
         self.annotations_manager.annotations[selected_lead].pop(i)
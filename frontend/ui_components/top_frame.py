@@ -1,14 +1,17 @@
 import logging
 import tkinter as tk
 from enum import Enum
+from functools import partial
 
 from tkinter import ttk
 from tkinter import filedialog as fd
 from tkinter import messagebox
 from typing import Callable
 
+from detectors.registry import available_detectors, create_detector
 from filters.ecg_signal_filter import FilterMethods, FilterConfig
 from frontend.app_variables import AppVariables
+from frontend.background_worker import BackgroundWorker, WorkerEvents
 from frontend.constants import APP_TITTLE
 from frontend.observers.annotations_manager import AnnotationsManager
 from frontend.observers.container_manager import ContainerManager, ContainerEvents
@@ -17,7 +20,7 @@ from frontend.observers.leads_manager import LeadsManager
 from frontend.observers.observer_abc import Observer
 from frontend.ui_components.leads_menu import LeadsMenuFrame
 from frontend.utils import merge_existing_annotations_with_lead
-from models.ecg import ECGContainer
+from models.ecg import ECGContainer, LeadName
 
 
 class TopFrame(tk.Frame):
@@ -34,6 +37,7 @@ class TopFrame(tk.Frame):
         filter_manager: FilterManager,
         load_signal_callback: Callable,
         app_variables: AppVariables,
+        worker: BackgroundWorker,
         *args,
         **kwargs,
     ):
@@ -46,6 +50,7 @@ class TopFrame(tk.Frame):
             annotations_manager=annotations_manager,
             filter_manager=filter_manager,
             load_signal_callback=load_signal_callback,
+            worker=worker,
         )
         self.action_buttons_frame.pack(anchor=tk.NW, side=tk.LEFT, fill=tk.Y)
 
@@ -117,7 +122,16 @@ class DescriptionFrame(tk.Frame, Observer):
         text_c.config(state=tk.DISABLED)
 
 
-class ActionButtonsFrame(tk.Frame):
+class ActionButtonsFrame(tk.Frame, Observer):
+    """
+    Subscribes for worker's state change. Widgets that read the container are disabled while a job may modify it,
+    except the detect button, which cancels running detection.
+    """
+
+    DETECTION_JOB = "detection"
+    DETECT_BUTTON_TEXT = "Detect QRS"
+    OPEN_BUTTON_TEXT = "Select ECG file"
+
     def __init__(
         self,
         parent: tk.Frame,
@@ -126,6 +140,7 @@ class ActionButtonsFrame(tk.Frame):
         annotations_manager: AnnotationsManager,
         filter_manager: FilterManager,
         load_signal_callback: Callable,
+        worker: BackgroundWorker,
         *args,
         **kwargs,
     ):
@@ -136,17 +151,19 @@ class ActionButtonsFrame(tk.Frame):
         self.annotations_manager = annotations_manager
         self.filter_manager = filter_manager
         self.load_signal_callback = load_signal_callback
+        self.worker = worker
+        self.worker.add_subscriber(self)
 
         self.open_button = tk.Button(
             self,
-            text="Select ECG file",
+            text=self.OPEN_BUTTON_TEXT,
             command=self._select_file_callback,
             bg="ivory4",
         )
 
         self.process_ecg_button = tk.Button(
             self,
-            text="Detect QRS",
+            text=self.DETECT_BUTTON_TEXT,
             command=self._process_signal_callback,
             state=tk.DISABLED,
         )
@@ -191,19 +208,60 @@ class ActionButtonsFrame(tk.Frame):
             state=tk.DISABLED,
         )
 
+        self.detector_entry = ttk.Combobox(
+            self, values=available_detectors(), state="readonly"
+        )
+        self.detector_entry.set(self.app_variables.detector_name)
+        self.detector_entry.bind("<<ComboboxSelected>>", self._detector_selected)
+
         self.open_button.grid(row=0, column=0, padx=5, pady=5, sticky="nesw")
         self.load_ann_button.grid(row=1, column=0, padx=5, pady=5, sticky="nesw")
         self.process_ecg_button.grid(row=0, column=1, padx=5, pady=5, sticky="nesw")
         self.clear_ann_button.grid(row=1, column=1, padx=5, pady=5, sticky="nesw")
         self.filters_setting_button.grid(row=2, column=0, padx=5, pady=5, sticky="nesw")
         self.processed_button.grid(row=3, column=0, padx=5, pady=5, sticky="nesw")
+        self.detector_entry.grid(row=2, column=1, padx=5, pady=5, sticky="nesw")
 
         self.filters_setting_window = None
 
     def _process_signal_callback(self):
+        """
+        Runs QRS detection in the background, the button shows its progress and cancels it when clicked again.
+        """
+        if self.worker.is_running(self.DETECTION_JOB):
+            logging.info("Processing cancelled")
+            self.worker.cancel(self.DETECTION_JOB)
+            self.process_ecg_button.configure(text=self.DETECT_BUTTON_TEXT)
+            return
+
         logging.info("Processing signal")
 
-        self.app_variables.explorer.process(True)
+        explorer = self.app_variables.explorer
+        # every lead is reported once filtered and once more when QRS detection is done
+        steps = 2 * len(self.container_manager.container.ecg_leads)
+        done_steps = []
+
+        def show_progress(lead_name: LeadName):
+            done_steps.append(lead_name)
+            self.process_ecg_button.configure(
+                text=f"Cancel ({100 * len(done_steps) // steps}%)"
+            )
+
+        def on_error(e: Exception):
+            self.process_ecg_button.configure(text=self.DETECT_BUTTON_TEXT)
+            tk.messagebox.showerror(title=APP_TITTLE, message=f"Processing failed: {e}")
+
+        self.worker.submit(
+            self.DETECTION_JOB,
+            partial(explorer.process, True),
+            on_done=self._on_processing_done,
+            on_progress=show_progress,
+            on_error=on_error,
+        )
+        self.process_ecg_button.configure(text="Cancel (0%)")
+
+    def _on_processing_done(self, _):
+        self.process_ecg_button.configure(text=self.DETECT_BUTTON_TEXT)
 
         updated_annotations = {}
         for lead in self.container_manager.container.ecg_leads:
@@ -215,6 +273,15 @@ class ActionButtonsFrame(tk.Frame):
         self.annotations_manager.annotations = updated_annotations
         tk.messagebox.showinfo(title=APP_TITTLE, message="Processing done!")
 
+    def _detector_selected(self, _):
+        self.app_variables.detector_name = self.detector_entry.get()
+        logging.info(f"Selected QRS detector {self.app_variables.detector_name}")
+
+        if self.app_variables.explorer is not None:
+            self.app_variables.explorer.detector = create_detector(
+                self.app_variables.detector_name
+            )
+
     def _select_file_callback(self):
         filetypes = (("Dicom files", "*.dcm"), ("XML files", "*.Xml"))
 
@@ -226,9 +293,20 @@ class ActionButtonsFrame(tk.Frame):
             tk.messagebox.showinfo(title=APP_TITTLE, message="File not selected")
             return
 
-        self.load_signal_callback(filename)
+        def on_loaded():
+            self.open_button.configure(text=self.OPEN_BUTTON_TEXT, state=tk.NORMAL)
+            tk.messagebox.showinfo(
+                title=APP_TITTLE, message="Successfully loaded file!"
+            )
+
+        def on_error(e: Exception):
+            self.open_button.configure(text=self.OPEN_BUTTON_TEXT, state=tk.NORMAL)
+            tk.messagebox.showerror(title=APP_TITTLE, message=f"Loading failed: {e}")
 
-        tk.messagebox.showinfo(title=APP_TITTLE, message="Successfully loaded file!")
+        # detection of the previous signal is cancelled
+        self.process_ecg_button.configure(text=self.DETECT_BUTTON_TEXT)
+        self.open_button.configure(text="Loading...", state=tk.DISABLED)
+        self.load_signal_callback(filename, on_loaded=on_loaded, on_error=on_error)
 
     def _clear_annotations_callback(self):
         should_continue = tk.messagebox.askyesno(
@@ -279,6 +357,7 @@ class ActionButtonsFrame(tk.Frame):
                 self.filter_manager,
                 self.container_manager,
                 self.app_variables,
+                self.worker,
                 self._settings_window_on_close_callback,
                 # self._settings_window_filter_changed_callback,
             )
@@ -286,20 +365,38 @@ class ActionButtonsFrame(tk.Frame):
     def _settings_window_on_close_callback(self):
         self.filters_setting_window = None
 
+    def update_on_notification(self, event: Enum, *args, **kwargs):
+        if (
+            event == WorkerEvents.BUSY_UPDATE
+            and self.app_variables.explorer is not None
+        ):
+            self._set_container_widgets_state(kwargs["busy"])
+
+    def _set_container_widgets_state(self, busy: bool):
+        state = tk.DISABLED if busy else tk.NORMAL
+        self.load_ann_button.configure(state=state)
+        self.processed_button.configure(state=state)
+
+        detection_running = self.worker.is_running(self.DETECTION_JOB)
+        self.process_ecg_button.configure(
+            state=tk.NORMAL if detection_running else state
+        )
+
     def activate_widgets(self):
-        self.process_ecg_button.configure(state=tk.NORMAL)
-        self.load_ann_button.configure(state=tk.NORMAL)
         self.clear_ann_button.configure(state=tk.NORMAL)
-        self.processed_button.configure(state=tk.NORMAL)
+        self._set_container_widgets_state(self.worker.busy)
 
 
 class FilterSettingsWindow(tk.Toplevel):
+    FILTERING_JOB = "filtering"
+
     def __init__(
         self,
         parent: tk.Frame,
         filter_manger: FilterManager,
         container_manger: ContainerManager,
         app_variables: AppVariables,
+        worker: BackgroundWorker,
         on_close_callback: Callable,
         # on_filter_change_callback: Callable,
         *args,
@@ -312,6 +409,7 @@ class FilterSettingsWindow(tk.Toplevel):
         self.filter_manager = filter_manger
         self.container_manger = container_manger
         self.app_variables = app_variables
+        self.worker = worker
 
         self.title("Filter settings")
 
@@ -343,6 +441,13 @@ class FilterSettingsWindow(tk.Toplevel):
         self.order_entry.insert(0, str(self.filter_manager.filter_config.filter_order))
         self.order_entry.pack(pady=10, padx=10)
 
+        self.zero_phase = tk.BooleanVar(
+            value=self.filter_manager.filter_config.zero_phase
+        )
+        tk.Checkbutton(
+            self, text="Zero-phase (forward-backward)", variable=self.zero_phase
+        ).pack(pady=10, padx=10)
+
         self.save_button = tk.Button(self, text="Save", command=self.save_settings)
         self.save_button.pack(side=tk.LEFT, padx=10, pady=10)
 
@@ -395,6 +500,7 @@ class FilterSettingsWindow(tk.Toplevel):
             filter_order=filter_order,
             highcut_frequency=highcut_frequency,
             lowcut_frequency=lowcut_frequency,
+            zero_phase=self.zero_phase.get(),
         )
 
         logging.info(f"Filter config {filter_config}")
@@ -405,11 +511,21 @@ class FilterSettingsWindow(tk.Toplevel):
             self.filter_manager.filter_config = filter_config
             if self.app_variables.explorer is not None:
                 # this line makes me thinking that the explorer should subscribe too 🤔
-                self.app_variables.explorer.filter_config = (
-                    self.filter_manager.filter_config
+                explorer = self.app_variables.explorer
+                container_manager = self.container_manger
+
+                def apply_filter(progress):
+                    explorer.filter_config = filter_config
+                    explorer.process(progress=progress)
+
+                # rapid changes are coalesced, the latest settings are applied only
+                self.worker.submit(
+                    self.FILTERING_JOB,
+                    apply_filter,
+                    on_done=lambda _: setattr(
+                        container_manager, "container", explorer.container
+                    ),
                 )
-                self.app_variables.explorer.process()
-                self.container_manger.container = self.app_variables.explorer.container
         else:
             logging.info("No filter changes")
 
@@ -0,0 +1,63 @@
+import numpy as np
+
+
+class MinMaxPyramid:
+    """
+    Level-of-detail representation of a waveform for plotting. Every level holds minimum and maximum of bins
+    of samples, each level's bins are `FACTOR` times longer than the previous one's. It's built once, then any
+    range of the waveform is rendered with a number of points that depends on the screen width only,
+    and peaks stay visible since every bin contributes its extremes.
+    """
+
+    FACTOR = 4
+
+    def __init__(self, waveform: np.ndarray[float]):
+        self.waveform = waveform
+        # bin size, bins minimums and maximums
+        self._levels: list[tuple[int, np.ndarray[float], np.ndarray[float]]] = []
+
+        bin_size, mins, maxs = 1, waveform, waveform
+        while mins.size > 1:
+            indices = np.arange(0, mins.size, self.FACTOR)
+            mins = np.minimum.reduceat(mins, indices)
+            maxs = np.maximum.reduceat(maxs, indices)
+            bin_size *= self.FACTOR
+            self._levels.append((bin_size, mins, maxs))
+
+    @property
+    def min(self) -> float:
+        return float(self._levels[-1][1][0]) if self._levels else self.waveform.min()
+
+    @property
+    def max(self) -> float:
+        return float(self._levels[-1][2][0]) if self._levels else self.waveform.max()
+
+    def view(
+        self, start: float, stop: float, max_points: int
+    ) -> tuple[np.ndarray[float], np.ndarray[float]]:
+        """
+        :param start: first sample of the visible range
+        :param stop: end of the visible range (exclusive)
+        :param max_points: e.g. twice the width of the plot in pixels
+        :return: x (sample positions) and y of the points to plot, no more than `max_points` of them - samples
+            themselves if the range has no more than `max_points` samples, otherwise minimum and maximum
+            of every bin of the finest level that fits, at the bin's center. The coarsest level is used
+            if none fits.
+        """
+        start = int(np.clip(np.floor(start), 0, self.waveform.size))
+        stop = int(np.clip(np.ceil(stop) + 1, start, self.waveform.size))
+
+        if stop - start <= max_points or not self._levels:
+            return np.arange(start, stop), self.waveform[start:stop]
+
+        for bin_size, mins, maxs in self._levels:
+            first, last = start // bin_size, -(-stop // bin_size)
+            # every bin gives two points
+            if 2 * (last - first) <= max_points:
+                break
+
+        centers = np.arange(first, last) * bin_size + (bin_size - 1) / 2
+        return (
+            np.repeat(centers, 2),
+            np.column_stack([mins[first:last], maxs[first:last]]).ravel(),
+        )
@@ -26,8 +26,8 @@ fig, axes = plt.subplots(len(data.ecg_leads), sharex=True)
 fig.suptitle("QRS complexes")
 
 for i, lead in enumerate(data.ecg_leads):
-    onsets = [i.onset for i in lead.ann.qrs_complex_positions]
-    offsets = [i.offset for i in lead.ann.qrs_complex_positions]
+    onsets = lead.ann.onsets
+    offsets = lead.ann.offsets
 
     axes[i].plot(lead.waveform)
     axes[i].set_title(f"Lead: {lead.label}")
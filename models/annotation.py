@@ -1,25 +1,106 @@
+from collections.abc import Iterable, Sequence
 from dataclasses import dataclass, field
 from typing import Optional
 
 import numpy as np
 
 
-@dataclass
+@dataclass(slots=True)
 class QRSComplex:
     onset: int
     offset: int
 
+    # explicit state keeps legacy (pickled before slots were used) annotation files loadable
+    def __getstate__(self):
+        return {"onset": self.onset, "offset": self.offset}
+
+    def __setstate__(self, state):
+        self.onset = state["onset"]
+        self.offset = state["offset"]
+
+
+def _empty_positions() -> np.ndarray[int]:
+    return np.zeros(0, dtype=np.int64)
+
+
+class QRSComplexes(Sequence):
+    """
+    Read-only view of annotation onsets and offsets columns, exposed as a sequence of QRSComplex.
+    Single beats are created only when accessed.
+    """
+
+    __slots__ = ("onsets", "offsets")
+
+    def __init__(self, onsets: np.ndarray[int], offsets: np.ndarray[int]):
+        self.onsets = onsets
+        self.offsets = offsets
+
+    def __len__(self):
+        return self.onsets.size
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return QRSComplexes(self.onsets[index], self.offsets[index])
+        return QRSComplex(int(self.onsets[index]), int(self.offsets[index]))
+
+    def __iter__(self):
+        for onset, offset in zip(self.onsets.tolist(), self.offsets.tolist()):
+            yield QRSComplex(onset, offset)
+
+    def __eq__(self, other):
+        if isinstance(other, QRSComplexes):
+            return np.array_equal(self.onsets, other.onsets) and np.array_equal(
+                self.offsets, other.offsets
+            )
+        if isinstance(other, Sequence):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return f"QRSComplexes(onsets={self.onsets}, offsets={self.offsets})"
+
 
 @dataclass
 class Annotation:
+    """
+    Annotations of a single lead. QRS complexes are stored as int64 onsets & offsets columns.
+    """
+
     path: Optional[str] = None
-    r_peak_positions: np.ndarray[int] = field(default_factory=list)
-    qrs_complex_positions: list[QRSComplex] = field(default_factory=list)
+    r_peak_positions: np.ndarray[int] = field(default_factory=_empty_positions)
+    onsets: np.ndarray[int] = field(default_factory=_empty_positions)
+    offsets: np.ndarray[int] = field(default_factory=_empty_positions)
 
     @property
-    def onsets(self):
-        return [i.onset for i in self.qrs_complex_positions]
+    def qrs_complex_positions(self) -> QRSComplexes:
+        return QRSComplexes(self.onsets, self.offsets)
+
+    @qrs_complex_positions.setter
+    def qrs_complex_positions(self, qrs_complexes: Iterable[QRSComplex]):
+        if isinstance(qrs_complexes, QRSComplexes):
+            self.onsets = qrs_complexes.onsets.copy()
+            self.offsets = qrs_complexes.offsets.copy()
+            return
+
+        qrs_complexes = list(qrs_complexes)
+        self.onsets = np.fromiter(
+            (x.onset for x in qrs_complexes), dtype=np.int64, count=len(qrs_complexes)
+        )
+        self.offsets = np.fromiter(
+            (x.offset for x in qrs_complexes), dtype=np.int64, count=len(qrs_complexes)
+        )
 
     @property
-    def offsets(self):
-        return [i.offset for i in self.qrs_complex_positions]
+    def qrs_lengths(self) -> np.ndarray[int]:
+        """
+        QRS complexes lengths in samples
+        """
+        return self.offsets - self.onsets
+
+    def __setstate__(self, state: dict):
+        # legacy annotation files stored QRS complexes as a list of objects
+        qrs_complexes = state.pop("qrs_complex_positions", None)
+        self.__dict__.update(state)
+        self.r_peak_positions = np.asarray(self.r_peak_positions, dtype=np.int64)
+        if qrs_complexes is not None:
+            self.qrs_complex_positions = qrs_complexes
@@ -0,0 +1,164 @@
+"""
+Annotation files (.annx) reading and writing.
+
+Format (version 1) is a binary file:
+    - prefix: magic bytes, format version and header size,
+    - JSON header with leads labels and number of R peaks and QRS complexes per lead,
+    - int64 arrays, for each lead: R peaks positions, QRS onsets and QRS offsets.
+
+Arrays are read on load with a single read of the file, and written to a temporary file that replaces the target,
+so a file can be saved over while its annotations are in use.
+Legacy files (pickled dict of `Annotation` objects) are still readable, but only known classes are unpickled.
+"""
+
+import json
+import os
+import pickle
+import struct
+
+import numpy as np
+
+from models.annotation import Annotation, QRSComplex
+
+ANNOTATIONS_FILE_MAGIC = b"ANNX"
+ANNOTATIONS_FILE_VERSION = 1
+ANNOTATIONS_FILE_PREFIX = struct.Struct("<4sHI")
+ANNOTATIONS_DTYPE = np.dtype("<i8")
+
+
+class AnnotationsFileError(RuntimeError):
+    def __init__(
+        self,
+        message="File you're trying to load is not an annotation file or is malformed",
+    ):
+        super().__init__(message)
+
+
+def save_annotations(filename: str, annotations: dict[str, Annotation]):
+    header = {"leads": []}
+    arrays = []
+
+    for label, ann in annotations.items():
+        r_peaks = np.asarray(ann.r_peak_positions, dtype=ANNOTATIONS_DTYPE)
+        onsets = np.asarray(ann.onsets, dtype=ANNOTATIONS_DTYPE)
+        offsets = np.asarray(ann.offsets, dtype=ANNOTATIONS_DTYPE)
+
+        header["leads"].append(
+            {
+                "label": label,
+                "path": ann.path,
+                "r_peaks": r_peaks.size,
+                "qrs_complexes": onsets.size,
+            }
+        )
+        arrays.extend([r_peaks, onsets, offsets])
+
+    header_bytes = json.dumps(header).encode()
+    # align arrays to their item size
+    padding = (
+        -(ANNOTATIONS_FILE_PREFIX.size + len(header_bytes)) % ANNOTATIONS_DTYPE.itemsize
+    )
+
+    # the target is replaced only once the whole file is written
+    tmp_filename = f"{filename}.tmp"
+    try:
+        with open(tmp_filename, "wb") as file:
+            file.write(
+                ANNOTATIONS_FILE_PREFIX.pack(
+                    ANNOTATIONS_FILE_MAGIC,
+                    ANNOTATIONS_FILE_VERSION,
+                    len(header_bytes) + padding,
+                )
+            )
+            file.write(header_bytes + b" " * padding)
+            for array in arrays:
+                file.write(array.tobytes())
+        os.replace(tmp_filename, filename)
+    except BaseException:
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
+        raise
+
+
+def load_annotations(filename: str) -> dict[str, Annotation]:
+    with open(filename, "rb") as file:
+        prefix = file.read(ANNOTATIONS_FILE_PREFIX.size)
+
+        if not prefix.startswith(ANNOTATIONS_FILE_MAGIC):
+            file.seek(0)
+            return _load_legacy_annotations(file)
+
+        _, version, header_size = ANNOTATIONS_FILE_PREFIX.unpack(prefix)
+        if version != ANNOTATIONS_FILE_VERSION:
+            raise AnnotationsFileError(
+                f"Annotation file version {version} not supported"
+            )
+
+        try:
+            header = json.loads(file.read(header_size))
+        except ValueError:
+            raise AnnotationsFileError()
+
+        leads = header["leads"]
+        total_size = sum(x["r_peaks"] + 2 * x["qrs_complexes"] for x in leads)
+        # read into memory - annotations must not depend on the file, it can be saved over
+        data = np.fromfile(file, dtype=ANNOTATIONS_DTYPE, count=total_size)
+
+    if data.size != total_size:
+        raise AnnotationsFileError()
+
+    annotations = {}
+    position = 0
+    for lead in leads:
+        r_peaks = data[position : position + lead["r_peaks"]]
+        position += lead["r_peaks"]
+        onsets = data[position : position + lead["qrs_complexes"]]
+        position += lead["qrs_complexes"]
+        offsets = data[position : position + lead["qrs_complexes"]]
+        position += lead["qrs_complexes"]
+
+        annotations[lead["label"]] = Annotation(
+            path=lead["path"],
+            r_peak_positions=r_peaks,
+            onsets=onsets,
+            offsets=offsets,
+        )
+
+    return annotations
+
+
+class _LegacyAnnotationsUnpickler(pickle.Unpickler):
+    """
+    Unpickles only annotation classes and numpy arrays - old files were plain pickles.
+    Classes are resolved by name, so they can be loaded even if modules were moved.
+    """
+
+    ANNOTATION_CLASSES = {"Annotation": Annotation, "QRSComplex": QRSComplex}
+    NUMPY_OBJECTS = {"_reconstruct", "_frombuffer", "scalar", "ndarray", "dtype"}
+
+    def find_class(self, module, name):
+        if name in self.ANNOTATION_CLASSES and "annotation" in module:
+            return self.ANNOTATION_CLASSES[name]
+        if module.startswith("numpy") and name in self.NUMPY_OBJECTS:
+            return super().find_class(module, name)
+        raise AnnotationsFileError(
+            f"Unexpected object in annotation file: {module}.{name}"
+        )
+
+
+def _load_legacy_annotations(file) -> dict[str, Annotation]:
+    try:
+        ann = _LegacyAnnotationsUnpickler(file).load()
+    except AnnotationsFileError:
+        raise
+    except Exception:
+        raise AnnotationsFileError()
+
+    if not isinstance(ann, dict):
+        raise AnnotationsFileError()
+
+    for k, v in ann.items():
+        if not isinstance(k, str) or not isinstance(v, Annotation):
+            raise AnnotationsFileError()
+
+    return ann
@@ -1,14 +1,18 @@
+import json
 import logging
-import pickle
+import struct
+from functools import partial
 
 import numpy as np
 import pydicom as dicom
+from pydicom.waveforms.numpy_handler import WAVEFORM_DTYPES
+from scipy import integrate
 
-from collections import defaultdict
 from dataclasses import dataclass, field
-from typing import Any, Optional, TypeAlias, List, Literal
+from typing import Any, Callable, Optional, TypeAlias, List, Literal
 from xml.etree import ElementTree as ET
 
+from models import annotation_io
 from models.annotation import Annotation
 
 LeadName: TypeAlias = str
@@ -17,7 +21,7 @@ LeadName: TypeAlias = str
 @dataclass
 class ECGLead:
     label: LeadName
-    raw_waveform: np.ndarray[float]
+    _raw_waveform: Optional[np.ndarray[float]]
     waveform: Optional[np.ndarray[float]] = None
     units: Optional[Literal["uV"]] = None
     fs: Optional[float] = None  # sampling frequency in Hz
@@ -25,14 +29,28 @@ class ECGLead:
 
     ann: Annotation = field(default_factory=Annotation)
 
+    # decodes raw waveform on the first access, set when the file was loaded lazily
+    waveform_loader: Optional[Callable[[], np.ndarray[float]]] = field(
+        default=None, repr=False, compare=False
+    )
+
     def __repr__(self):
         return f"\n{self.label}: \n\tunits: {self.units} \n\tsampling: {self.fs}Hz \n\tdata: {self.waveform}\n"
 
+    @property
+    def raw_waveform(self) -> np.ndarray[float]:
+        if self._raw_waveform is None and self.waveform_loader is not None:
+            self._raw_waveform = self.waveform_loader()
+            self.waveform_loader = None
+        return self._raw_waveform
+
+    @raw_waveform.setter
+    def raw_waveform(self, raw_waveform: np.ndarray[float]):
+        self._raw_waveform = raw_waveform
+        self.waveform_loader = None
+
     def calculate_qrs_lengths(self) -> List[float]:
-        return [
-            (pos.offset - pos.onset) / self.fs * 1000
-            for pos in self.ann.qrs_complex_positions or []
-        ]
+        return (self.ann.qrs_lengths / self.fs * 1000).tolist()
 
     def calculate_qrs_areas(self) -> list[float]:
         if self.units == "uV":
@@ -40,14 +58,22 @@ class ECGLead:
         else:
             raise RuntimeError(f"Unit {self.units} not known")
 
-        areas = np.zeros(len(self.ann.qrs_complex_positions or []))
+        # area of [onset, offset) is the difference of cumulative integral at its last and first sample
+        cumulative_area = integrate.cumulative_trapezoid(
+            np.abs(waveform), dx=1 / self.fs, initial=0
+        )
 
-        for cnt, pos in enumerate(self.ann.qrs_complex_positions or []):
-            waveform_abs = np.abs(waveform[pos.onset : pos.offset])
+        onsets = np.clip(self.ann.onsets, 0, waveform.size)
+        last_samples = np.clip(self.ann.offsets, 0, waveform.size) - 1
 
-            areas[cnt] = np.trapz(waveform_abs, dx=1 / self.fs)
+        areas = np.where(
+            last_samples > onsets,
+            cumulative_area[np.maximum(last_samples, 0)]
+            - cumulative_area[np.minimum(onsets, waveform.size - 1)],
+            0.0,
+        )
 
-        return list(map(lambda x: float(f"{x:.2f}"), areas.tolist()))
+        return np.round(areas, 2).tolist()
 
 
 class ECGContainer:
@@ -66,6 +92,23 @@ class ECGContainer:
         "V6",
     ]
 
+    GE_XML_WAVEFORM_PATH = (
+        "sapphire",
+        "xmlData",
+        "block",
+        "params",
+        "ecg",
+        "wav",
+        "ecgWaveformMXG",
+    )
+    GE_XML_PATIENT_INFO_PATH = ("sapphire", "demographics", "patientInfo")
+
+    # mapped file layout: prefix (magic, version, header size), JSON header, padding, leads x samples array
+    MAPPED_FILE_MAGIC = b"ECGC"
+    MAPPED_FILE_VERSION = 1
+    MAPPED_FILE_PREFIX = struct.Struct("<4sHI")
+    MAPPED_FILE_ALIGNMENT = 64
+
     def __init__(
         self, ecg_leads: list[ECGLead], raw: Any, description: str, file_path: str
     ):
@@ -74,6 +117,52 @@ class ECGContainer:
         self.description: str = description
         self.file_path: str = file_path
 
+        self._raw_waveforms: Optional[np.ndarray[float]] = None
+        # lazily loaded leads are gathered once decoded, on the first access
+        if all(lead.waveform_loader is None for lead in self.ecg_leads):
+            self._raw_waveforms = self._consolidate_raw_waveforms()
+
+    @property
+    def raw_waveforms(self) -> Optional[np.ndarray[float]]:
+        """
+        Raw waveforms of all leads as a single C-ordered leads x samples array. Leads' raw waveforms are
+        its row views, so the whole matrix can be processed at once. None if leads have different lengths.
+        """
+        if self._raw_waveforms is None:
+            self._raw_waveforms = self._consolidate_raw_waveforms()
+        return self._raw_waveforms
+
+    def _consolidate_raw_waveforms(self) -> Optional[np.ndarray[float]]:
+        waveforms = [lead.raw_waveform for lead in self.ecg_leads]
+        if (
+            not waveforms
+            or any(x is None for x in waveforms)
+            or len({x.shape for x in waveforms}) > 1
+        ):
+            return None
+
+        # leads might be rows of a contiguous array already, e.g. when opened from a mapped file
+        base = waveforms[0].base
+        if (
+            isinstance(base, np.ndarray)
+            and base.ndim == 2
+            and base.flags.c_contiguous
+            and base.shape[0] == len(waveforms)
+            and all(
+                x.base is base
+                and x.flags.c_contiguous
+                and x.ctypes.data == base[ii].ctypes.data
+                for ii, x in enumerate(waveforms)
+            )
+        ):
+            return base
+
+        raw_waveforms = np.stack(waveforms).astype(np.float64, copy=False)
+        for lead, row in zip(self.ecg_leads, raw_waveforms):
+            lead.raw_waveform = row
+
+        return raw_waveforms
+
     def _sort_leads(self, ecg_leads: list[ECGLead]) -> list[ECGLead]:
         return [
             lead
@@ -120,9 +209,15 @@ class ECGContainer:
                 raise AttributeError(f"Lead name {lead} not known!")
 
     @classmethod
-    def from_dicom_file(cls, path: str):
+    def from_dicom_file(cls, path: str, lazy: bool = False):
+        """
+        :param lazy: don't decode waveforms up front, a channel is decoded on the first access
+            to its lead raw waveform. Only raw (integer) samples are kept in memory until then.
+        """
         try:
-            raw = dicom.dcmread(path)
+            # top level elements bigger than defer size are read from the file only on access.
+            # Note that pydicom reads sequence items (so waveform data too) as a whole.
+            raw = dicom.dcmread(path, defer_size="1 KB" if lazy else None)
         except Exception as e:
             logging.warning(f"Couldn't read dicom file: {path}. Reason: {e}")
             raise e
@@ -130,7 +225,7 @@ class ECGContainer:
             logging.info(f"Loaded file successfully {path}")
 
         waveform = raw.WaveformSequence[0]
-        waveform_data = raw.waveform_array(0)
+        waveform_data = raw.waveform_array(0) if not lazy else None
         leads = list()
 
         for ii, channel in enumerate(waveform.ChannelDefinitionSequence):
@@ -142,11 +237,15 @@ class ECGContainer:
             if units == "microvolt":
                 units = "uV"
 
-            leads.append(
-                ECGLead(
+            if lazy:
+                lead = ECGLead(label, None, None, units, waveform.SamplingFrequency)
+                lead.waveform_loader = partial(decode_dicom_channel, raw, 0, ii)
+            else:
+                lead = ECGLead(
                     label, waveform_data[:, ii], None, units, waveform.SamplingFrequency
                 )
-            )
+
+            leads.append(lead)
 
         return cls(
             leads,
@@ -157,125 +256,211 @@ class ECGContainer:
 
     @classmethod
     def from_ge_xml_file(cls, path):
-        def extract_leads(file_dict: dict) -> list[ECGLead]:
-            ecg_dict = file_dict["sapphire"]["xmlData"]["block"]["params"]["ecg"][
-                "wav"
-            ]["ecgWaveformMXG"]
-
-            sample_rate_unit = ecg_dict["sampleRate"]["U"]
-            sample_rate = int(ecg_dict["sampleRate"]["V"])
+        """
+        Streams the file and keeps only what's needed - waveforms are decoded as soon as their element
+        is parsed and the element is released right after, so large exports never live in memory as a whole.
+        Patient info element is kept as the raw data.
+        """
+
+        def parse_sample_rate(element: ET.Element) -> float:
+            sample_rate_unit = element.get("U")
+            sample_rate = int(element.get("V"))
             if sample_rate_unit == "Hz":
-                sample_rate_hz = sample_rate
+                return sample_rate
             elif sample_rate_unit == "kHz":
-                sample_rate_hz = sample_rate / 1000
+                return sample_rate / 1000
             else:
                 raise RuntimeError(
                     "GE XML - could not parse sample rate. Unit not known"
                 )
 
-            leads_object = ecg_dict["ecgWaveform"]
-            leads_from_file = (
-                [leads_object] if type(leads_object) is not list else leads_object
-            )
+        def parse_lead(element: ET.Element) -> tuple[LeadName, str, np.ndarray[float]]:
+            label = cls.normalize_lead_name(element.get("lead"))
+            units = element.get("U")
+            magic_number = element.get("S")
+            # parsing numbers in C, without creating python float per sample
+            waveform_data = np.fromstring(
+                element.get("V"), dtype=np.float64, sep=" "
+            ) * float(magic_number)
+            return label, units, waveform_data
+
+        def extract_description(patient_info: Optional[ET.Element]) -> str:
+            if patient_info is None:
+                return " "
+
+            name = find_child(patient_info, "name")
+            if name is None:
+                return " "
 
-            leads = list()
-            for lead in leads_from_file:
-                label = cls.normalize_lead_name(lead["lead"])
-                units = lead["U"]
-                magic_number = lead["S"]
-                waveform_str: str = lead["V"]
-                waveform_data = np.fromiter(
-                    map(lambda x: float(x), waveform_str.split(" ")), dtype=np.float_
-                ) * float(magic_number)
-
-                leads.append(ECGLead(label, waveform_data, None, units, sample_rate_hz))
-
-            return leads
-
-        def extract_description(file_dict: dict) -> str:
-            given_names_list = (
-                file_dict["sapphire"]["demographics"]["patientInfo"]
-                .get("name", {})
-                .get("given", [])
-            )
             given_names = [
-                x.get("V", "")
-                for x in given_names_list
-                if x.get("V") is not None and x["V"] != "NONE"
+                x.get("V")
+                for x in name
+                if clean_up_tag(x.tag) == "given"
+                and x.get("V") is not None
+                and x.get("V") != "NONE"
             ]
-
-            family_name = (
-                file_dict["sapphire"]["demographics"]["patientInfo"]
-                .get("name", {})
-                .get("family", {})
-                .get("V", "")
-            )
+            family = find_child(name, "family")
+            family_name = family.get("V", "") if family is not None else ""
 
             return " ".join(given_names) + " " + family_name
 
+        def find_child(element: ET.Element, tag: str) -> Optional[ET.Element]:
+            return next((x for x in element if clean_up_tag(x.tag) == tag), None)
+
         try:
-            root = ET.parse(path).getroot()
-            xml_dict = etree_to_dict(root)
-            leads = extract_leads(xml_dict)
-            description = extract_description(xml_dict)
+            sample_rate_hz = None
+            parsed_leads = []
+            patient_info = None
+
+            tags = []
+            for event, element in ET.iterparse(path, events=("start", "end")):
+                if event == "start":
+                    tags.append(clean_up_tag(element.tag))
+                    continue
+
+                element_path = tuple(tags)
+                tags.pop()
+
+                if element_path == cls.GE_XML_WAVEFORM_PATH + ("sampleRate",):
+                    sample_rate_hz = parse_sample_rate(element)
+                elif element_path == cls.GE_XML_WAVEFORM_PATH + ("ecgWaveform",):
+                    parsed_leads.append(parse_lead(element))
+                elif element_path == cls.GE_XML_PATIENT_INFO_PATH:
+                    patient_info = element
+
+                if (
+                    element_path[: len(cls.GE_XML_PATIENT_INFO_PATH)]
+                    != cls.GE_XML_PATIENT_INFO_PATH
+                ):
+                    element.clear()
+
+            if sample_rate_hz is None or not parsed_leads:
+                raise RuntimeError("GE XML - could not find ECG waveforms")
+
+            leads = [
+                ECGLead(label, waveform_data, None, units, sample_rate_hz)
+                for label, units, waveform_data in parsed_leads
+            ]
+            description = extract_description(patient_info)
         except Exception as e:
             logging.warning(f"Couldn't read GE XLM file: {path}. Reason: {e}")
             raise e
         else:
             logging.info(f"Loaded file successfully {path}")
 
-        return cls(leads, root, description, path)
+        return cls(leads, patient_info, description, path)
+
+    def save_mapped(self, path: str):
+        """
+        Saves decoded leads as a single contiguous leads x samples array with a small metadata header.
+        Such file can be opened with `from_mapped_file` without any decoding.
+        """
+        if self.raw_waveforms is None:
+            raise RuntimeError("Only leads of equal length can be saved as mapped file")
+
+        waveforms = self.raw_waveforms
+
+        header = {
+            "labels": [lead.label for lead in self.ecg_leads],
+            "units": [lead.units for lead in self.ecg_leads],
+            "fs": [lead.fs for lead in self.ecg_leads],
+            "description": self.description,
+            "file_path": self.file_path,
+            "dtype": waveforms.dtype.str,
+            "shape": waveforms.shape,
+        }
+        header_bytes = json.dumps(header).encode()
+
+        data_offset = self.MAPPED_FILE_PREFIX.size + len(header_bytes)
+        padding = -data_offset % self.MAPPED_FILE_ALIGNMENT
+
+        with open(path, "wb") as file:
+            file.write(
+                self.MAPPED_FILE_PREFIX.pack(
+                    self.MAPPED_FILE_MAGIC,
+                    self.MAPPED_FILE_VERSION,
+                    len(header_bytes) + padding,
+                )
+            )
+            file.write(header_bytes + b" " * padding)
+            file.write(waveforms.tobytes())
 
-    def save_annotations(self, filename):
-        annotations = {lead.label: lead.ann for lead in self.ecg_leads}
+    @classmethod
+    def from_mapped_file(cls, path: str):
+        """
+        Opens file written by `save_mapped`. Waveforms are read-only, zero-copy row views of a memory-mapped
+        array, so pages are loaded on demand and shared between processes opening the same file.
+        """
+        with open(path, "rb") as file:
+            magic, version, header_size = cls.MAPPED_FILE_PREFIX.unpack(
+                file.read(cls.MAPPED_FILE_PREFIX.size)
+            )
+            if magic != cls.MAPPED_FILE_MAGIC or version != cls.MAPPED_FILE_VERSION:
+                raise RuntimeError(
+                    f"File {path} is not a mapped ECG file version {cls.MAPPED_FILE_VERSION}"
+                )
+
+            header = json.loads(file.read(header_size))
+
+        waveforms = np.memmap(
+            path,
+            dtype=np.dtype(header["dtype"]),
+            mode="r",
+            offset=cls.MAPPED_FILE_PREFIX.size + header_size,
+            shape=tuple(header["shape"]),
+        )
+
+        leads = [
+            ECGLead(label, waveforms[ii], None, units, fs)
+            for ii, (label, units, fs) in enumerate(
+                zip(header["labels"], header["units"], header["fs"])
+            )
+        ]
 
-        with open(filename, "wb") as file:
-            pickle.dump(annotations, file, protocol=pickle.HIGHEST_PROTOCOL)
+        return cls(leads, None, header["description"], header["file_path"])
+
+    def save_annotations(self, filename):
+        annotation_io.save_annotations(
+            filename, {lead.label: lead.ann for lead in self.ecg_leads}
+        )
 
     def load_annotations(self, filename):
-        with open(filename, "rb") as file:
-            ann = pickle.load(file)
+        for k, v in annotation_io.load_annotations(filename).items():
+            # legacy leads had "Lead" prefix.
+            if "Lead " in k:
+                k = k.replace("Lead ", "")
 
-            if not isinstance(ann, dict):
-                raise RuntimeError(
-                    "File you're trying to load is not an annotation file or is malformed"
-                )
+            self.get_lead(k).ann = v
 
-            for k, v in ann.items():
-                if not isinstance(k, str) and not isinstance(v, Annotation):
-                    raise RuntimeError(
-                        "File you're trying to load is not an annotation file or is malformed"
-                    )
-
-                # legacy leads had "Lead" prefix.
-                if "Lead " in k:
-                    k = k.replace("Lead ", "")
-
-                self.get_lead(k).ann = v
-
-
-def etree_to_dict(t):
-    def clean_up_tag(tag):
-        if "}" in tag:
-            return tag.split("}")[1]
-        return tag
-
-    tag = clean_up_tag(t.tag)
-    d = {tag: {} if t.attrib else None}
-    children = list(t)
-    if children:
-        dd = defaultdict(list)
-        for dc in map(etree_to_dict, children):
-            for k, v in dc.items():
-                dd[k].append(v)
-        d = {tag: {k: v[0] if len(v) == 1 else v for k, v in dd.items()}}
-    if t.attrib:
-        d[tag].update((k, v) for k, v in t.attrib.items())
-    if t.text:
-        text = t.text.strip()
-        if children or t.attrib:
-            if text:
-                d[tag]["#text"] = text
-        else:
-            d[tag] = text
-    return d
+
+def decode_dicom_channel(
+    raw: dicom.Dataset, multiplex_group: int, channel: int
+) -> np.ndarray[float]:
+    """
+    Decodes a single channel of dicom waveform, the same way `Dataset.waveform_array` does for all of them.
+    """
+    item = raw.WaveformSequence[multiplex_group]
+
+    nr_samples = item.NumberOfWaveformSamples
+    nr_channels = item.NumberOfWaveformChannels
+    bits_allocated = item.WaveformBitsAllocated
+    dtype = WAVEFORM_DTYPES[(bits_allocated, item.WaveformSampleInterpretation)]
+    expected_len = nr_samples * nr_channels * bits_allocated // 8
+
+    # samples are interleaved: C1S1, C2S1, ..., CnS1, C1S2, ...
+    samples = np.frombuffer(item.WaveformData[:expected_len], dtype=dtype).reshape(
+        nr_samples, nr_channels
+    )[:, channel]
+
+    channel_definition = item.ChannelDefinitionSequence[channel]
+    baseline = channel_definition.get("ChannelBaseline", 0.0)
+    sensitivity = channel_definition.get("ChannelSensitivity", 1.0)
+    correction = channel_definition.get("ChannelSensitivityCorrectionFactor", 1.0)
+
+    return samples.astype(float) * sensitivity * correction + baseline
+
+
+def clean_up_tag(tag: str) -> str:
+    if "}" in tag:
+        return tag.split("}")[1]
+    return tag
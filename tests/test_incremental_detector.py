@@ -0,0 +1,29 @@
+import numpy as np
+
+from detectors.incremental_detector import IncrementalPanTompkinsDetector
+
+FS = 360
+
+
+def _pulse(signal: np.ndarray[float], position: int, amplitude: float):
+    t = np.arange(-20, 21)
+    signal[position + t] += amplitude * np.exp(-((t / 5) ** 2))
+
+
+def test_history_stays_bounded_after_a_single_beat():
+    # a single beat, then equal low bumps - all of them noise peaks, without RR intervals for search-back
+    signal = np.zeros(300 * FS)
+    _pulse(signal, int(2.5 * FS), 1000)
+    for position in range(3 * FS, signal.size - FS, FS // 4):
+        _pulse(signal, position, 10)
+
+    detector = IncrementalPanTompkinsDetector(FS)
+    beats = 0
+    max_size = 0
+    for start in range(0, signal.size, FS):
+        beats += detector.push(signal[start : start + FS]).r_peak_positions.size
+        max_size = max(max_size, detector._signal.size)
+    beats += detector.finish().r_peak_positions.size
+
+    assert beats == 1
+    assert max_size <= 2 * FS
@@ -0,0 +1,108 @@
+from types import SimpleNamespace
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pytest
+from matplotlib.backend_bases import MouseEvent
+
+from frontend.observers.annotations_manager import AnnotationsManager
+from frontend.observers.container_manager import ContainerManager
+from frontend.observers.filter_config_manager import FilterManager
+from frontend.observers.leads_manager import LeadsManager
+from frontend.ui_components.plot_handler import ECGPlotHandler
+from models.annotation import QRSComplex
+from models.ecg import ECGContainer, ECGLead
+
+FS = 1000
+
+
+@pytest.fixture
+def plot_handler() -> ECGPlotHandler:
+    """
+    Handler with the figure drawn by Agg, Tk widgets aren't created.
+    """
+    rng = np.random.default_rng(0)
+    waveforms = rng.normal(0, 100, (2, 5 * FS))
+    leads = [
+        ECGLead(name, waveform, waveform, "uV", FS)
+        for name, waveform in zip(("I", "II"), waveforms)
+    ]
+    container = ECGContainer(leads, None, "test", "synthetic")
+
+    handler = object.__new__(ECGPlotHandler)
+    handler.fig = plt.figure(figsize=(10, 6))
+    handler.canvas = SimpleNamespace(
+        draw_idle=handler.fig.canvas.draw_idle,
+        get_tk_widget=lambda: SimpleNamespace(pack=lambda **kwargs: None),
+    )
+    handler.ax_properties = {}
+    handler.span_managers = {}
+    handler.cursors = {}
+    handler.waveform_lods = {}
+    handler.mouse_event = None
+
+    handler.leads_manager = LeadsManager()
+    handler.annotations_manager = AnnotationsManager()
+    handler.container_manager = ContainerManager()
+    handler.filter_manager = FilterManager()
+    for manager in (
+        handler.leads_manager,
+        handler.annotations_manager,
+        handler.container_manager,
+        handler.filter_manager,
+    ):
+        manager.add_subscriber(handler)
+
+    handler.leads_manager.set_mapping_from_ecg_container(container)
+    handler.annotations_manager.empty_from_ecg_container(container)
+    handler.container_manager.container = container
+    handler.fig.canvas.draw()
+
+    yield handler
+    plt.close(handler.fig)
+
+
+def _mouse_event(ax, name: str, x: float) -> MouseEvent:
+    px, py = ax.transData.transform((x, 0))
+    return MouseEvent(name, ax.figure.canvas, px, py, button=1)
+
+
+def test_dragging_span_edge_resizes_its_annotation(plot_handler):
+    annotations = plot_handler.annotations_manager.annotations
+    annotations["I"] = [QRSComplex(1000, 1100)]
+    plot_handler.annotations_manager.annotations = annotations
+
+    ax = plot_handler.ax_properties["I"].ax
+    callbacks = ax.figure.canvas.callbacks
+    callbacks.process(
+        "button_press_event", _mouse_event(ax, "button_press_event", 1095)
+    )
+    callbacks.process(
+        "motion_notify_event", _mouse_event(ax, "motion_notify_event", 1200)
+    )
+    callbacks.process(
+        "button_release_event", _mouse_event(ax, "button_release_event", 1200)
+    )
+
+    (qrs_complex,) = plot_handler.annotations_manager.annotations["I"]
+    assert qrs_complex.onset == 1000
+    assert qrs_complex.offset == pytest.approx(1205, abs=1)
+
+    span = plot_handler.span_managers["I"].spans[0]
+    assert (span.onset, round(span.offset)) == (qrs_complex.onset, qrs_complex.offset)
+
+
+def test_cursor_shows_sample_of_decimated_line(plot_handler):
+    ax_props = plot_handler.ax_properties["I"]
+    waveform = ax_props.waveform_lod.waveform
+    # the whole record is visible, so the line holds bins' minimums and maximums
+    assert ax_props.line.get_xdata().size < waveform.size
+
+    x, y = plot_handler.cursors["I"].set_position(1234.4, 0)
+
+    assert x == 1234
+    assert y == pytest.approx(waveform[1234] / 1000)
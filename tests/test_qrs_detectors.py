@@ -0,0 +1,16 @@
+import numpy as np
+
+from detectors.qrs_detectors import PanTompkinsDetector
+
+FS = 360
+
+
+def test_delineation_without_zero_crossings_falls_back_to_window_bounds():
+    detector = PanTompkinsDetector()
+    # a half of the minimal peak distance around peaks
+    shift = int(detector.min_peak_distance * FS / 1000 / 2)
+
+    onsets, offsets = detector._delineate(np.zeros(2000), np.array([1000, 1999]), FS)
+
+    np.testing.assert_array_equal(onsets, [1000 - shift, 1999 - shift])
+    np.testing.assert_array_equal(offsets, [1000 + shift - 1, 1999])
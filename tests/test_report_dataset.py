@@ -0,0 +1,41 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from explorer.report_dataset import (
+    ReportDatasetWriter,
+    read_records,
+    read_report_dataset,
+)
+
+
+def _report(leads: list[str], beats: int) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "lead": np.repeat(leads, beats),
+            "annotation": np.tile(np.arange(beats), len(leads)),
+            "width_ms": 100.0,
+            "area_uV.s": 10.0,
+        }
+    )
+
+
+def test_dataset_is_partitioned_by_lead(tmp_path):
+    with ReportDatasetWriter(str(tmp_path), use_parquet=False) as writer:
+        writer.append("a.xml", _report(["I", "II"], 3))
+        writer.append("b.xml", _report(["I"], 2))
+        writer.append("empty.xml", _report(["I", "II"], 0))
+
+    assert sorted(x for x in os.listdir(tmp_path) if x.startswith("lead=")) == [
+        "lead=I",
+        "lead=II",
+    ]
+
+    data = read_report_dataset(str(tmp_path))
+    assert data.groupby(["record", "lead"], observed=True).size().to_dict() == {
+        ("a.xml", "I"): 3,
+        ("a.xml", "II"): 3,
+        ("b.xml", "I"): 2,
+    }
+    assert read_records(str(tmp_path)) == {"a.xml", "b.xml", "empty.xml"}
@@ -0,0 +1,16 @@
+import numpy as np
+import pytest
+
+from frontend.waveform_lod import MinMaxPyramid
+
+
+@pytest.mark.parametrize("max_points", [2, 100, 1000, 4096])
+def test_view_has_no_more_than_max_points(max_points):
+    waveform = np.random.default_rng(0).normal(size=100_000)
+    pyramid = MinMaxPyramid(waveform)
+
+    x, y = pyramid.view(1234.5, 98765.4, max_points)
+
+    assert x.size == y.size <= max_points
+    assert y.max() == waveform[1234:98767].max()
+    assert y.min() == waveform[1234:98767].min()